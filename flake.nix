@@ -10,7 +10,7 @@
   let
     system = "x86_64-linux";
     pkgs = import nixpkgs { inherit system; };
-    python = pkgs.python38.withPackages (ps: with ps; [ django_3 ]);
+    python = pkgs.python38.withPackages (ps: with ps; [ django_3 numpy brotli ]);
   in
   {
     devShell.${system} = pkgs.stdenv.mkDerivation {
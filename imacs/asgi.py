@@ -9,8 +9,13 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+from imacs_app.asgi import get_asgi_application # iterates the streaming responses in a thread
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'imacs.settings')
 
 application = get_asgi_application()
+
+from imacs_app.events import EventsApplication # after the setup of Django
+
+# Serves the live updates of the todo pages, which Django 3.2 cannot stream from a view
+application = EventsApplication(application)
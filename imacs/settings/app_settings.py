@@ -23,11 +23,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'imacs_app.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'imacs_app.middleware.FastAuthenticationMiddleware', # AuthenticationMiddleware unless IMACS_FAST_AUTH
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -38,7 +39,6 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -46,6 +46,14 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compiled templates are kept in memory, also with DEBUG (the runserver
+            # autoreloader resets them when a template changes)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -90,6 +98,10 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Stylesheets whose unused rules are removed by collectstatic, with the storage of the
+# deployments (imacs_app.storage.CompressedManifestStaticFilesStorage, see nix.py)
+IMACS_PURGED_CSS = ['imacs_app/bulma-0.9.3.min.css']
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -98,3 +110,79 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_URL = '/login'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
+
+# Cache of the task list pages, see imacs_app/caching.py
+# The version counters of the task lists are stored in the cache, so it must be shared
+# by all the worker processes (e.g. use the file based backend with several workers).
+# The {% cache %} fragments of the templates (task list tabs) also go there.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+IMACS_CACHE_TIMEOUT = 60 # in seconds, bounds the drift of the cached priorities
+IMACS_CACHE_STATS_INTERVAL = 10 # in seconds, between the writes of the hit and miss counts of a process to the cache
+
+# Async versions of the read-heavy views, for ASGI deployments (see imacs_app/views.py).
+# Under WSGI they would go through a sync adapter for nothing.
+
+IMACS_ASYNC_VIEWS = False
+IMACS_ASYNC_CONCURRENT_QUERIES = True # run the independent queries of a view in parallel threads
+
+# Live updates of the todo pages over Server-Sent Events, see imacs_app/events.py.
+# The stream is only served by the ASGI application.
+
+IMACS_LIVE_UPDATES = False
+IMACS_EVENTS_BACKEND = 'imacs_app.events.LocalBackend' # in-process, for a single worker
+
+# Reads of the GET requests on replicas, enabled by the settings/replicas.py layer (see imacs_app/routers.py)
+
+IMACS_READ_REPLICAS = [] # aliases of DATABASES
+IMACS_REPLICA_PIN_COOKIE = 'imacs_primary'
+IMACS_REPLICA_PIN_SECONDS = 10 # the reads of a browser stay on the primary after a write, must exceed the replication lag
+
+# OPTIONS of the SQLite database of the settings/sqlite.py production profile (see imacs_app/backends/sqlite3)
+
+IMACS_SQLITE_PRODUCTION_OPTIONS = {
+    'init_command': ';'.join([
+        'PRAGMA busy_timeout=5000', # in milliseconds, how long a writer waits for the lock (first, the next pragmas may wait)
+        'PRAGMA journal_mode=WAL', # the readers and the writer no longer block each other
+        'PRAGMA synchronous=NORMAL', # no fsync per commit in WAL mode, a power loss may only undo the last commits
+        'PRAGMA mmap_size=268435456', # 256 MiB of the file read through the page cache of the OS
+        'PRAGMA cache_size=-16000', # 16 MB of pages cached per connection
+        'PRAGMA temp_store=MEMORY',
+    ]),
+    'transaction_mode': 'IMMEDIATE', # the transactions wait for the lock at BEGIN instead of failing when they write
+    'optimize_interval': 3600, # in seconds, how often `PRAGMA optimize` runs
+}
+
+# Users and task list memberships read from the cache instead of the database, see
+# imacs_app/authentication.py. Pair it with a session engine reading from the cache (see nix.py).
+
+IMACS_FAST_AUTH = False
+IMACS_FAST_AUTH_TIMEOUT = 3600 # in seconds, bounds the staleness after a change without signals
+
+# Request timing, see imacs_app/middleware.py
+
+IMACS_SERVER_TIMING = True
+IMACS_SLOW_REQUEST_MS = 500
+IMACS_SLOW_REQUEST_QUERIES = 50
+IMACS_SLOW_REQUEST_STATEMENTS = 5 # number of SQL statements in a slow request log
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'imacs_app.slow_requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
@@ -3,6 +3,8 @@ from .app_settings import *
 
 SECRET_KEY=environ.get('SECRET_KEY')
 STATIC_ROOT=environ.get('STATIC_ROOT')
+# Hashed names, purged CSS and precompressed files, served by nginx (see module.nix)
+STATICFILES_STORAGE = 'imacs_app.storage.CompressedManifestStaticFilesStorage'
 ALLOWED_HOSTS = list(environ.get('ALLOWED_HOSTS', default='').split(','))
 DATABASES = {
     'default': {
@@ -11,6 +13,28 @@ DATABASES = {
         'HOST': '',
     }
 }
+# Shared by all the workers, unlike the default local memory cache: the version counters
+# of the cached task list pages must be (see imacs_app/caching.py). module.nix creates the directory.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': environ.get('CACHE_DIR', '/var/cache/imacs'),
+    }
+}
+if environ.get('IMACS_ASGI'):
+    IMACS_ASYNC_VIEWS = True
+    IMACS_LIVE_UPDATES = True
+    # The concurrent queries of the async views each use a connection of a worker thread
+    DATABASES['default']['CONN_MAX_AGE'] = 60
+if environ.get('IMACS_FAST_AUTH'):
+    # Users and memberships from the cache (imacs_app/authentication.py), and sessions too: from the
+    # cache backed by the database, or with IMACS_FAST_AUTH=signed_cookies from the session cookie
+    # itself (no server side logout of the other devices, and the cookie is sent with every request)
+    IMACS_FAST_AUTH = True
+    if environ.get('IMACS_FAST_AUTH') == 'signed_cookies':
+        SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+    else:
+        SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 DEBUG = False
 SECURE_SSL_REDIRECT = False
 SESSION_COOKIE_SECURE = False
@@ -0,0 +1,26 @@
+"""Read replicas, a layer on top of the settings module named by IMACS_BASE_SETTINGS
+(default: imacs.settings.nix). See imacs_app/routers.py.
+
+DB_REPLICAS is a comma separated list of the replicas of DATABASES['default']: their
+hosts with PostgreSQL, their files with SQLite. Locally, with two SQLite databases:
+
+    export DJANGO_SETTINGS_MODULE=imacs.settings.replicas IMACS_BASE_SETTINGS=imacs.settings.dev DB_REPLICAS=db-replica.sqlite3
+    python manage.py sync_sqlite_replicas # the "replication", run it again to catch up
+    python manage.py runserver
+"""
+
+from importlib import import_module
+from os import environ
+
+_base = import_module(environ.get('IMACS_BASE_SETTINGS', 'imacs.settings.nix'))
+globals().update({name: value for name, value in vars(_base).items() if name.isupper()})
+
+_location = 'NAME' if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3' else 'HOST'
+DATABASES = dict(DATABASES)
+IMACS_READ_REPLICAS = []
+for _i, _replica in enumerate(filter(None, environ.get('DB_REPLICAS', '').split(','))):
+    DATABASES[f'replica{_i + 1}'] = {**DATABASES['default'], _location: _replica.strip()}
+    IMACS_READ_REPLICAS.append(f'replica{_i + 1}')
+
+DATABASE_ROUTERS = ['imacs_app.routers.ReplicaRouter']
+MIDDLEWARE = ['imacs_app.middleware.ReplicaRoutingMiddleware', *MIDDLEWARE]
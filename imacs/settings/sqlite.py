@@ -0,0 +1,41 @@
+"""SQLite production profile, for the small deployments: a layer on top of the settings
+module named by IMACS_BASE_SETTINGS (default: imacs.settings.nix) whose database becomes
+the SQLite file SQLITE_PATH (default: the database of the base settings, if it is SQLite),
+tuned for concurrent use by IMACS_SQLITE_PRODUCTION_OPTIONS (see imacs_app/backends/sqlite3).
+
+    export DJANGO_SETTINGS_MODULE=imacs.settings.sqlite SQLITE_PATH=/var/lib/imacs/db.sqlite3
+    python manage.py migrate
+    python manage.py stress_sqlite # the throughput and "database is locked" errors, with and without the profile
+
+The database file, its -wal and -shm files must be on a local disk (not NFS): WAL mode
+shares memory between the processes of the host.
+
+The pragmas of `init_command` run on every new connection, so the connections persist
+across requests for SQLITE_CONN_MAX_AGE seconds (default: 600) instead of being opened
+per request. Django 3.2 has no CONN_HEALTH_CHECKS, a persistent connection is only
+checked after a request with a database error: a connection to a local file does not
+go stale like a network one. `PRAGMA optimize` runs when they close (`optimize_interval`).
+"""
+
+from importlib import import_module
+from os import environ
+
+from django.core.exceptions import ImproperlyConfigured
+
+_base = import_module(environ.get('IMACS_BASE_SETTINGS', 'imacs.settings.nix'))
+globals().update({name: value for name, value in vars(_base).items() if name.isupper()})
+
+_path = environ.get('SQLITE_PATH')
+if not _path:
+    if DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3':
+        raise ImproperlyConfigured("Set SQLITE_PATH to the database file of the SQLite production profile")
+    _path = DATABASES['default']['NAME']
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'imacs_app.backends.sqlite3',
+        'NAME': _path,
+        'OPTIONS': IMACS_SQLITE_PRODUCTION_OPTIONS,
+        'CONN_MAX_AGE': int(environ.get('SQLITE_CONN_MAX_AGE', 600)),
+    }
+}
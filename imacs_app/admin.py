@@ -1,8 +1,9 @@
 from django.contrib import admin
 
-from .models import TaskList, TaskCategory, Task, TaskDone
+from .models import TaskList, TaskCategory, Task, TaskDone, TaskDoneRollup
 
 admin.site.register(TaskList)
 admin.site.register(TaskCategory)
 admin.site.register(Task)
 admin.site.register(TaskDone)
+admin.site.register(TaskDoneRollup)
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ImacsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'imacs_app'
+
+    def ready(self):
+        from . import caching # connects the cache invalidation signals
+        from . import events # connects the live update signals
+        from . import authentication # connects the invalidation signals of the cached users and memberships
+        from django.db.backends.signals import connection_created
+        from .middleware import install_query_recorder
+        connection_created.connect(install_query_recorder)
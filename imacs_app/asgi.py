@@ -0,0 +1,39 @@
+"""ASGI handler of the application (see imacs/asgi.py).
+
+Django 3.2 iterates over the streaming responses in the event loop, where the ORM
+refuses to run (SynchronousOnlyOperation): the body of e.g. the export of a task
+list, which reads the completions with `.iterator()`, would abort after its
+headers. `ASGIHandler` iterates over them in the thread of the sync code of the
+request instead, `chunk_parts` parts at a time.
+"""
+
+from itertools import islice
+
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers import asgi
+
+class ASGIHandler(asgi.ASGIHandler):
+    chunk_parts = 500
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [(header.encode('ascii'), value.encode('latin1')) for header, value in response.items()]
+        for cookie in response.cookies.values():
+            headers.append((b'Set-Cookie', cookie.output(header='').encode('ascii').strip()))
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        parts = iter(response)
+        next_parts = sync_to_async(lambda: list(islice(parts, self.chunk_parts)), thread_sensitive=True)
+        while True:
+            chunk = await next_parts()
+            if not chunk:
+                break
+            await send({'type': 'http.response.body', 'body': b''.join(chunk), 'more_body': True})
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+def get_asgi_application():
+    """`django.core.asgi.get_asgi_application` with `ASGIHandler`"""
+    django.setup(set_prefix=False)
+    return ASGIHandler()
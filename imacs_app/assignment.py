@@ -0,0 +1,75 @@
+"""Automatic assignment of the due tasks of a task list to its members.
+
+The unassigned tasks which are due (priority of at least 1, or never done) are
+spread over the members with the LPT (longest processing time first) heuristic:
+the tasks are taken from the longest to the shortest, the most urgent first for
+equal durations, and each one goes to the member with the least load, kept in a
+heap. The load of a member starts at the minutes already tasked to them, the
+same numbers as the goals of the todo page (`TaskListStats.hours_per_user`), so
+the members below `hour_per_week_per_user` are filled first.
+
+Completions do not record who did them, so the load cannot account for the work
+done recently by each member.
+"""
+
+import heapq
+
+from django.db import models, transaction
+
+from .models import Task
+from .caching import bump_version
+from .events import publish_tasks_on_commit
+
+def due_tasks(task_list, now=None):
+    return (Task.objects.filter(task_category__task_list=task_list, tasked_user=None)
+        .with_priority(now)
+        .filter(models.Q(annotated_priority=None) | models.Q(annotated_priority__gte=1))
+        .order_by())
+
+def plan(tasks, loads):
+    """Spread `tasks` over the users of `loads` ({user id: minutes already tasked}), return {task id: user id}"""
+    heap = [(load, user_id) for user_id, load in loads.items()]
+    heapq.heapify(heap)
+    if not heap:
+        return {}
+    def urgency(task):
+        return float('inf') if task.annotated_priority is None else task.annotated_priority
+    assignments = {}
+    for task in sorted(tasks, key=lambda task: (-task.duration, -urgency(task), task.pk)):
+        load, user_id = heap[0]
+        assignments[task.pk] = user_id
+        heapq.heapreplace(heap, (load + task.duration, user_id))
+    return assignments
+
+def assign(task_list, now=None, batch_size=1000):
+    """Assign the due unassigned tasks of `task_list` to its members and return {task id: user id}.
+
+    The assignments are written with one UPDATE per `batch_size` tasks, which only
+    touches the tasks still unassigned.
+    """
+    with transaction.atomic():
+        loads = {user_id: 0 for user_id in task_list.users.values_list('pk', flat=True)}
+        tasked = (Task.objects.filter(task_category__task_list=task_list, tasked_user__in=loads)
+            .order_by()
+            .values('tasked_user')
+            .annotate(minutes=models.Sum('duration')))
+        for row in tasked:
+            loads[row['tasked_user']] = row['minutes'] or 0
+        tasks = due_tasks(task_list, now).only('pk', 'duration', 'last_done_at', 'period')
+        assignments = plan(tasks, loads)
+
+        items = list(assignments.items())
+        for i in range(0, len(items), batch_size):
+            batch = items[i:i + batch_size]
+            task_ids_per_user = {}
+            for task_id, user_id in batch:
+                task_ids_per_user.setdefault(user_id, []).append(task_id)
+            Task.objects.filter(pk__in=[task_id for task_id, _ in batch], tasked_user=None).update(tasked_user=models.Case(
+                *[models.When(pk__in=task_ids, then=models.Value(user_id)) for user_id, task_ids in task_ids_per_user.items()],
+                output_field=models.IntegerField(),
+            ))
+        publish_tasks_on_commit(task_list.pk, assignments)
+    if assignments:
+        # Bulk updates do not send the signals which invalidate the cache
+        bump_version(task_list.pk)
+    return assignments
@@ -0,0 +1,106 @@
+"""Fast authentication (IMACS_FAST_AUTH): the users of the sessions and the task lists
+they are members of are read from the cache instead of the database.
+
+- `get_user` is `django.contrib.auth.get_user` with the user read from the cache,
+  installed by `middleware.FastAuthenticationMiddleware`. The session hash is still
+  checked against the cached user, which is dropped whenever the user is saved
+  (e.g. a new password) or deleted,
+- `get_task_list_ids` is the set of the task lists of a user, dropped by the
+  signals of `TaskList.users`, used by the permission mixins of the views.
+
+The cache must be shared by the worker processes, the middleware refuses to start
+otherwise (`check_cache`). The cached users and memberships also expire after
+`IMACS_FAST_AUTH_TIMEOUT` seconds, which bounds the staleness after a change without
+signals (e.g. `User.objects.update()`). The sessions themselves
+come from the cache with the cached_db (or signed_cookies) SESSION_ENGINE, see nix.py.
+"""
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+
+from .caching import get_cache, is_shared_cache
+from .models import TaskList
+
+def is_enabled():
+    return getattr(settings, 'IMACS_FAST_AUTH', False)
+
+def check_cache():
+    """The signals only drop the entries of the cache of their process: the other workers must see it"""
+    if is_enabled() and not is_shared_cache():
+        raise ImproperlyConfigured(
+            "IMACS_FAST_AUTH needs a cache shared by all the worker processes (e.g. the file based cache), "
+            "otherwise a password change or a removed member is still accepted by the other workers")
+
+def get_timeout():
+    return getattr(settings, 'IMACS_FAST_AUTH_TIMEOUT', 3600)
+
+def user_key(user_id):
+    return f'imacs:user:{user_id}'
+
+def task_lists_key(user_id):
+    return f'imacs:user:{user_id}:task_lists'
+
+def get_user(request):
+    if not is_enabled():
+        return auth.get_user(request)
+    try:
+        user_id = auth._get_user_session_key(request)
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    cache = get_cache()
+    user = cache.get(user_key(user_id))
+    if user is None:
+        user = auth.load_backend(backend_path).get_user(user_id)
+        if user is None:
+            return AnonymousUser()
+        cache.set(user_key(user_id), user, timeout=get_timeout())
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(session_hash, user.get_session_auth_hash())):
+        # Let Django flush the session (or accept a legacy hash)
+        return auth.get_user(request)
+    return user
+
+def get_task_list_ids(user):
+    """Ids of the task lists `user` is a member of"""
+    cache = get_cache()
+    task_list_ids = cache.get(task_lists_key(user.pk))
+    if task_list_ids is None:
+        task_list_ids = frozenset(user.tasklist_set.values_list('pk', flat=True))
+        cache.set(task_lists_key(user.pk), task_list_ids, timeout=get_timeout())
+    return task_list_ids
+
+def is_member(user, task_list_id):
+    if not user.is_authenticated:
+        return False
+    if is_enabled():
+        return task_list_id in get_task_list_ids(user)
+    return TaskList.objects.filter(pk=task_list_id, users=user).exists()
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    get_cache().delete_many([user_key(instance.pk), task_lists_key(instance.pk)])
+
+@receiver(m2m_changed, sender=TaskList.users.through)
+def task_list_users_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # `instance` is a user
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            get_cache().delete(task_lists_key(instance.pk))
+    elif action in ('post_add', 'post_remove'):
+        get_cache().delete_many([task_lists_key(user_id) for user_id in pk_set])
+    elif action == 'pre_clear':
+        # `pk_set` is None: look the members up before they are removed
+        get_cache().delete_many([task_lists_key(user_id) for user_id in instance.users.values_list('pk', flat=True)])
+
+@receiver(pre_delete, sender=TaskList)
+def task_list_deleted(sender, instance, **kwargs):
+    # The memberships are deleted without m2m signals
+    get_cache().delete_many([task_lists_key(user_id) for user_id in instance.users.values_list('pk', flat=True)])
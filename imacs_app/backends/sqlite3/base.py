@@ -0,0 +1,68 @@
+"""SQLite backend of the SQLite production profile (imacs/settings/sqlite.py).
+
+The SQLite backend of Django, with the two OPTIONS that Django 5.1 added to it:
+- `init_command`: the statements (separated by ';') run on every new connection,
+  e.g. the pragmas, which SQLite does not keep in the database file,
+- `transaction_mode`: "DEFERRED" (the default), "IMMEDIATE" or "EXCLUSIVE", how the
+  transactions begin. An IMMEDIATE transaction takes the write lock at BEGIN, where
+  it waits for the other writers within the busy timeout, so that the transactions
+  which read then write do not fail on "database is locked" when they upgrade their
+  read lock (the busy timeout is not applied to this upgrade).
+and one of its own:
+- `optimize_interval`: at most once per this number of seconds, `PRAGMA optimize`
+  runs before closing a connection, as the SQLite documentation recommends, to
+  refresh the statistics of the query planner. None to never run it.
+"""
+
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = {'DEFERRED', 'IMMEDIATE', 'EXCLUSIVE'}
+CUSTOM_OPTIONS = ('init_command', 'transaction_mode', 'optimize_interval')
+
+# Time of the last `PRAGMA optimize` of this process, by database file
+last_optimize = {}
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        for name in CUSTOM_OPTIONS:
+            kwargs.pop(name, None)
+        transaction_mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if transaction_mode is not None and transaction_mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"settings.DATABASES is improperly configured. The transaction_mode must be one of "
+                f"{', '.join(sorted(TRANSACTION_MODES))}, not {transaction_mode!r}")
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        init_command = self.settings_dict['OPTIONS'].get('init_command')
+        if init_command:
+            for statement in init_command.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        transaction_mode = self.settings_dict['OPTIONS'].get('transaction_mode')
+        if transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {transaction_mode.upper()}')
+
+    def close(self):
+        interval = self.settings_dict['OPTIONS'].get('optimize_interval')
+        if interval is not None and self.connection is not None and not self.in_atomic_block:
+            name = self.settings_dict['NAME']
+            now = time.monotonic()
+            if now - last_optimize.get(name, -interval) >= interval:
+                last_optimize[name] = now
+                try:
+                    self.connection.execute('PRAGMA optimize')
+                except base.Database.Error:
+                    # Only statistics, the connection is closing anyway
+                    pass
+        super().close()
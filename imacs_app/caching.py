@@ -0,0 +1,147 @@
+"""Per-TaskList cache of the expensive computations of the task list pages.
+
+Every entry is keyed by a version of its TaskList, which is bumped by the signals
+below whenever a task, category, completion or member of the list changes. The
+version is the time of the last change (in nanoseconds), so it doubles as the
+Last-Modified date of the list.
+Priorities drift with wall-clock time, so entries also expire after
+`IMACS_CACHE_TIMEOUT` seconds.
+"""
+
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import TaskList, TaskCategory, Task, TaskDone, get_task_list_id
+
+HITS_KEY = 'imacs:cache:hits'
+MISSES_KEY = 'imacs:cache:misses'
+
+_missing = object()
+
+# The hits and misses of this process not yet added to the cache, see `count`
+_counts = Counter()
+_counts_lock = threading.Lock()
+_counts_flushed_at = time.monotonic()
+
+def get_cache():
+    return caches[getattr(settings, 'IMACS_CACHE_ALIAS', 'default')]
+
+def is_shared_cache():
+    """Whether the cache is seen by all the worker processes, unlike the memory of each process"""
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+def get_timeout():
+    return getattr(settings, 'IMACS_CACHE_TIMEOUT', 60)
+
+def version_key(task_list_id):
+    return f'imacs:task_list:{task_list_id}:version'
+
+def get_version(task_list_id):
+    cache = get_cache()
+    key = version_key(task_list_id)
+    version = cache.get(key)
+    if version is None:
+        # The last change is unknown (e.g. the version was evicted), assume it is now
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+def bump_version(task_list_id):
+    get_cache().set(version_key(task_list_id), time.time_ns(), timeout=None)
+
+def get_last_modified(task_list_id):
+    return datetime.fromtimestamp(get_version(task_list_id)/1e9, tz=timezone.utc)
+
+def get_stats_interval():
+    return getattr(settings, 'IMACS_CACHE_STATS_INTERVAL', 10)
+
+def count(key):
+    """Count a hit or a miss in this process, they are added to the shared counters every `IMACS_CACHE_STATS_INTERVAL` seconds.
+
+    A write of the cache per lookup would be a locked rewrite of a file with the
+    file based backend.
+    """
+    with _counts_lock:
+        _counts[key] += 1
+        if time.monotonic() - _counts_flushed_at < get_stats_interval():
+            return
+    flush_counts()
+
+def flush_counts():
+    global _counts_flushed_at
+    with _counts_lock:
+        counts = dict(_counts)
+        _counts.clear()
+        _counts_flushed_at = time.monotonic()
+    cache = get_cache()
+    for key, delta in counts.items():
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            cache.add(key, delta, timeout=None)
+
+def cached(task_list_id, name, compute):
+    """Return the cached value `name` of the task list, calling `compute()` on a miss."""
+    cache = get_cache()
+    key = f'imacs:task_list:{task_list_id}:{get_version(task_list_id)}:{name}'
+    value = cache.get(key, _missing)
+    if value is _missing:
+        count(MISSES_KEY)
+        value = compute()
+        cache.set(key, value, timeout=get_timeout())
+    else:
+        count(HITS_KEY)
+    return value
+
+def cached_todo(task_list_id):
+    return cached(task_list_id, 'todo', lambda: list(Task.objects.filter(task_category__task_list__id = task_list_id).by_priority()))
+
+def cached_stats(task_list):
+    return cached(task_list.pk, 'stats', task_list.stats)
+
+def cache_info():
+    flush_counts()
+    cache = get_cache()
+    return {'hits': cache.get(HITS_KEY, 0), 'misses': cache.get(MISSES_KEY, 0)}
+
+@receiver([post_save, post_delete], sender=TaskList)
+def task_list_changed(sender, instance, **kwargs):
+    bump_version(instance.pk)
+
+@receiver([post_save, post_delete], sender=TaskCategory)
+def task_category_changed(sender, instance, **kwargs):
+    bump_version(instance.task_list_id)
+
+@receiver([post_save, post_delete], sender=Task)
+def task_changed(sender, instance, **kwargs):
+    task_list_id = get_task_list_id(instance)
+    if task_list_id is not None:
+        bump_version(task_list_id)
+
+@receiver([post_save, post_delete], sender=TaskDone)
+def task_done_changed(sender, instance, **kwargs):
+    task_list_id = get_task_list_id(instance)
+    if task_list_id is not None:
+        bump_version(task_list_id)
+
+@receiver(m2m_changed, sender=TaskList.users.through)
+def task_list_users_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            bump_version(instance.pk)
+    elif action in ('post_add', 'post_remove'):
+        for task_list_id in pk_set:
+            bump_version(task_list_id)
+    elif action == 'pre_clear':
+        # `instance` is a user and `pk_set` is None: look the lists up before they are removed
+        for task_list_id in instance.tasklist_set.values_list('pk', flat=True):
+            bump_version(task_list_id)
@@ -0,0 +1,207 @@
+"""Live updates of the todo pages, over Server-Sent Events.
+
+Saving or deleting a task or a completion publishes, once the transaction is
+committed, a patch of the affected rows (priority, tasked user, last completion)
+to the channel of its task list. `EventsApplication` wraps the ASGI application
+and streams the messages of a channel to the open todo pages of the members,
+which patch their rows instead of reloading (see static/imacs_app/todo.js).
+
+Django 3.2 iterates over streaming responses synchronously, even under ASGI, so
+the stream is served by this small ASGI application rather than by a view.
+
+The pub/sub backend is the `IMACS_EVENTS_BACKEND` class. `LocalBackend` only
+reaches the subscribers of its own process: it fits a single ASGI worker and the
+tests, and stands in for a broker backend implementing the same methods.
+"""
+
+import asyncio
+import json
+from functools import lru_cache
+from importlib import import_module
+from io import BytesIO
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.signals import setting_changed, request_started, request_finished
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.urls import Resolver404, resolve
+from django.utils.module_loading import import_string
+
+from .models import Task, TaskDone, get_task_list_id
+from . import authentication
+
+class LocalBackend:
+    """In-process pub/sub. `publish` may be called from any thread, `subscribe` from an event loop."""
+    def __init__(self, max_pending=100):
+        self.max_pending = max_pending
+        self.subscribers = {} # channel -> {(loop, queue)}
+
+    def has_subscribers(self, channel):
+        return bool(self.subscribers.get(channel))
+
+    def publish(self, channel, message):
+        for loop, queue in list(self.subscribers.get(channel, ())):
+            loop.call_soon_threadsafe(self.put, queue, message)
+
+    def put(self, queue, message):
+        if queue.full():
+            # A stalled client: its page is stale anyway, tell it to reload
+            while not queue.empty():
+                queue.get_nowait()
+            message = {'event': 'reload'}
+        queue.put_nowait(message)
+
+    def subscribe(self, channel):
+        return LocalSubscription(self, channel)
+
+class LocalSubscription:
+    """Async context manager, the messages are read with `await subscription.get()`"""
+    def __init__(self, backend, channel):
+        self.backend = backend
+        self.channel = channel
+        self.queue = asyncio.Queue(backend.max_pending)
+        self.entry = (asyncio.get_event_loop(), self.queue)
+
+    async def __aenter__(self):
+        self.backend.subscribers.setdefault(self.channel, set()).add(self.entry)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        subscribers = self.backend.subscribers.get(self.channel, set())
+        subscribers.discard(self.entry)
+        if not subscribers:
+            self.backend.subscribers.pop(self.channel, None)
+
+    async def get(self):
+        return await self.queue.get()
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(getattr(settings, 'IMACS_EVENTS_BACKEND', 'imacs_app.events.LocalBackend'))()
+
+@receiver(setting_changed)
+def reset_backend(setting, **kwargs):
+    if setting == 'IMACS_EVENTS_BACKEND':
+        get_backend.cache_clear()
+
+def channel_name(task_list_id):
+    return f'imacs:task_list:{task_list_id}'
+
+def task_patch(task):
+    return {
+        'id': task.pk,
+        'priority': task.annotated_priority, # null when never done
+        'tasked_user': task.tasked_user.username if task.tasked_user else None,
+        'last_done': task.last_done_at.isoformat() if task.last_done_at else None,
+    }
+
+def publish_tasks(task_list_id, task_ids):
+    """Publish the current state of the given tasks (the deleted ones are removed)"""
+    backend = get_backend()
+    channel = channel_name(task_list_id)
+    if not backend.has_subscribers(channel):
+        return
+    tasks = Task.objects.filter(pk__in=task_ids).with_priority().select_related('tasked_user')
+    patches = [task_patch(task) for task in tasks]
+    removed = sorted(set(task_ids) - {patch['id'] for patch in patches})
+    backend.publish(channel, {'event': 'tasks', 'data': {'tasks': patches, 'removed': removed}})
+
+def publish_tasks_on_commit(task_list_id, task_ids):
+    """The bulk operations, which do not send signals, call this themselves"""
+    task_ids = list(task_ids)
+    if get_backend().has_subscribers(channel_name(task_list_id)):
+        transaction.on_commit(lambda: publish_tasks(task_list_id, task_ids))
+
+def has_subscribers(task_list_id):
+    return task_list_id is not None and get_backend().has_subscribers(channel_name(task_list_id))
+
+@receiver([post_save, post_delete], sender=Task)
+def task_changed(sender, instance, **kwargs):
+    task_list_id = get_task_list_id(instance)
+    if not has_subscribers(task_list_id):
+        return
+    publish_tasks_on_commit(task_list_id, [instance.pk])
+
+@receiver([post_save, post_delete], sender=TaskDone)
+def task_done_changed(sender, instance, **kwargs):
+    task_list_id = get_task_list_id(instance)
+    if not has_subscribers(task_list_id):
+        return
+    publish_tasks_on_commit(task_list_id, [instance.task_id])
+
+def format_event(message):
+    return f"event: {message['event']}\ndata: {json.dumps(message.get('data'))}\n\n".encode()
+
+class EventsApplication:
+    """ASGI application serving the `imacs_app:task_list_events` streams, and passing the other requests to `application`"""
+    keepalive = 15 # seconds between two comments, so that the proxies keep the connection open
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        task_list_id = self.get_task_list_id(scope)
+        if task_list_id is None:
+            return await self.application(scope, receive, send)
+        if not await sync_to_async(self.check_permission)(scope, task_list_id):
+            await send({'type': 'http.response.start', 'status': 403, 'headers': [(b'content-type', b'text/plain')]})
+            return await send({'type': 'http.response.body', 'body': b'Forbidden'})
+        await self.stream(channel_name(task_list_id), receive, send)
+
+    def get_task_list_id(self, scope):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            return None
+        try:
+            match = resolve(scope['path'])
+        except Resolver404:
+            return None
+        if match.view_name != 'imacs_app:task_list_events':
+            return None
+        return match.kwargs['task_list_id']
+
+    def check_permission(self, scope, task_list_id):
+        """Whether the user of the session can view the task list. The stream itself does not use the database,
+        so the request ends here for Django (and the database connection is released)."""
+        request_started.send(sender=self.__class__, scope=scope)
+        try:
+            request = ASGIRequest(scope, BytesIO())
+            engine = import_module(settings.SESSION_ENGINE)
+            request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+            return authentication.is_member(authentication.get_user(request), task_list_id)
+        finally:
+            request_finished.send(sender=self.__class__)
+
+    async def stream(self, channel, receive, send):
+        async with get_backend().subscribe(channel) as subscription:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'), # nginx
+            ]})
+            await send({'type': 'http.response.body', 'body': b': connected\n\n', 'more_body': True})
+            disconnect = asyncio.ensure_future(self.wait_disconnect(receive))
+            message = None
+            try:
+                while True:
+                    if message is None:
+                        message = asyncio.ensure_future(subscription.get())
+                    done, _ = await asyncio.wait([message, disconnect], timeout=self.keepalive, return_when=asyncio.FIRST_COMPLETED)
+                    if disconnect in done:
+                        break
+                    if message in done:
+                        body = format_event(message.result())
+                        message = None
+                    else:
+                        body = b': keepalive\n\n'
+                    await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+            finally:
+                disconnect.cancel()
+                if message is not None:
+                    message.cancel()
+
+    async def wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
@@ -0,0 +1,72 @@
+"""Forecast of the minutes of chores per day over the next weeks.
+
+A task is expected to be done again `period` days after its last completion,
+then every `period` days. The tasks which are overdue or were never done are
+expected today. The tasks are loaded into arrays and every occurrence in the
+horizon is expanded at once with NumPy, then summed per day (and per tasked
+user) with `bincount`, so the cost is one query plus a few vectorized passes
+over the occurrences.
+"""
+
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.utils import timezone
+
+from .models import Task, days_since_epoch
+
+MAX_WEEKS = 52
+
+def occurrences(last_done, period, start, nb_days):
+    """Return the task index and the day index (from `start`, in days since the epoch) of every occurrence in the horizon.
+
+    `last_done` is in days since the epoch, NaN for the tasks never done.
+    """
+    next_due = np.where(np.isnan(last_done), start, last_done + period)
+    first_day = np.maximum(np.floor(next_due - start), 0).astype(np.int64)
+    counts = np.where(first_day < nb_days, -((first_day - nb_days)//period), 0)
+    task_index = np.repeat(np.arange(len(period)), counts)
+    # Rank of each occurrence among the ones of its task
+    rank = np.arange(len(task_index)) - np.repeat(np.cumsum(counts) - counts, counts)
+    day_index = first_day[task_index] + rank*period[task_index]
+    return task_index, day_index
+
+class Forecast:
+    """Minutes per day over `weeks` weeks from today, in total and per tasked user (None for the unassigned tasks)"""
+    def __init__(self, task_list, weeks=4, now=None):
+        if now is None:
+            now = timezone.now()
+        today = timezone.localdate(now)
+        nb_days = 7*weeks
+        self.weeks = weeks
+        start = days_since_epoch(timezone.make_aware(datetime.combine(today, time())))
+
+        rows = list(Task.objects.filter(task_category__task_list=task_list).order_by().values_list('duration', 'period', 'last_done_at', 'tasked_user_id'))
+        duration = np.array([row[0] for row in rows], dtype=np.float64)
+        period = np.array([row[1] for row in rows], dtype=np.int64)
+        last_done = np.array([days_since_epoch(row[2]) if row[2] else np.nan for row in rows], dtype=np.float64)
+        self.users = list(task_list.users.order_by('pk'))
+        user_index = {user.pk: i for i, user in enumerate(self.users)}
+        # The unassigned tasks (and the ones of former members) go in the last row
+        tasked = np.array([user_index.get(row[3], len(self.users)) for row in rows], dtype=np.int64)
+
+        task_index, day_index = occurrences(last_done, period, start, nb_days)
+        per_user = np.bincount(tasked[task_index]*nb_days + day_index, weights=duration[task_index], minlength=(len(self.users) + 1)*nb_days)
+        per_user = per_user.reshape(len(self.users) + 1, nb_days)
+
+        self.days = [today + timedelta(days=i) for i in range(nb_days)]
+        self.total = per_user.sum(axis=0)
+        self.per_user = [(user, per_user[i]) for i, user in enumerate(self.users)] + [(None, per_user[-1])]
+
+    def rows(self):
+        """(day, total minutes, minutes per user in the order of `per_user`) for every day"""
+        for i, day in enumerate(self.days):
+            yield day, self.total[i], [minutes[i] for _, minutes in self.per_user]
+
+    def as_dict(self):
+        return {
+            'weeks': self.weeks,
+            'days': [day.isoformat() for day in self.days],
+            'total': self.total.tolist(),
+            'per_user': [{'user': user.username if user else None, 'minutes': minutes.tolist()} for user, minutes in self.per_user],
+        }
@@ -0,0 +1,21 @@
+"""Helpers of the benchmark commands (benchmark_*, stress_sqlite)"""
+
+from django.core.management.base import CommandError
+from django.db.models import Count
+
+from imacs_app.models import TaskList
+
+def get_task_list(task_list_id=None, with_members=True):
+    """The task list to run a benchmark on: `task_list_id`, by default the one with the most tasks.
+
+    The views need a member to log in as, `with_members=False` when the benchmark does not go through them.
+    """
+    task_lists = TaskList.objects.all()
+    if with_members:
+        task_lists = task_lists.filter(pk__in=TaskList.users.through.objects.values('tasklist_id'))
+    if task_list_id is not None:
+        task_lists = task_lists.filter(pk=task_list_id)
+    task_list = task_lists.annotate(nb_tasks=Count('taskcategory__task')).filter(nb_tasks__gt=0).order_by('-nb_tasks').first()
+    if task_list is None:
+        raise CommandError(f"No task list with {'members and ' if with_members else ''}tasks found, run the seed_workload command first")
+    return task_list
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from imacs_app.assignment import assign
+from imacs_app.models import TaskList
+
+class Command(BaseCommand):
+    help = "Assign the due unassigned tasks of task lists to their members, balancing their load"
+
+    def add_arguments(self, parser):
+        parser.add_argument('task_list', type=int, nargs='*', help="Ids of the task lists (default: all of them)")
+
+    def handle(self, *args, **options):
+        task_lists = TaskList.objects.order_by('pk')
+        if options['task_list']:
+            task_lists = task_lists.filter(pk__in=options['task_list'])
+            missing = set(options['task_list']) - set(task_lists.values_list('pk', flat=True))
+            if missing:
+                raise CommandError(f"Unknown task lists: {', '.join(map(str, sorted(missing)))}")
+        for task_list in task_lists:
+            start = time.perf_counter()
+            assignments = assign(task_list)
+            duration = time.perf_counter() - start
+            self.stdout.write(f"Task list {task_list.pk} '{task_list}': assigned {len(assignments)} tasks in {1000*duration:.0f}ms")
@@ -0,0 +1,102 @@
+import asyncio
+import importlib
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, AsyncClient, override_settings
+from django.test.utils import setup_test_environment
+from django.urls import reverse, clear_url_caches
+
+import imacs.urls
+from imacs_app import urls
+from imacs_app.management.benchmarking import get_task_list
+
+READ_VIEWS = ['task_list_todo', 'task_list_summary', 'task_list_my_tasks', 'task_list_completions']
+
+class Command(BaseCommand):
+    help = ("Compare the sync views under the WSGI handler (one thread per client) with the async views under "
+        "the ASGI handler (one coroutine per client) for concurrent clients of the read-heavy pages, in process")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--task-list', type=int, help="Id of the task list to use (default: the one with the most tasks)")
+        parser.add_argument('--clients', type=int, default=16, help="Number of concurrent clients")
+        parser.add_argument('--requests', type=int, default=20, help="Number of requests per client")
+        parser.add_argument('--handler', choices=['wsgi', 'asgi', 'both'], default='both')
+        parser.add_argument('--warm', action='store_true', help="Use the cache instead of disabling it")
+
+    def get_urls(self, task_list, nb):
+        return [reverse(f'imacs_app:{READ_VIEWS[i%len(READ_VIEWS)]}', kwargs={'task_list_id': task_list.pk}) for i in range(nb)]
+
+    def run_wsgi(self, cookies, urls_per_client):
+        def run_client(client_urls):
+            client = Client()
+            client.cookies = cookies
+            latencies = []
+            for url in client_urls:
+                start = time.perf_counter()
+                response = client.get(url)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise CommandError(f"{url} returned {response.status_code}")
+            return latencies
+        with ThreadPoolExecutor(len(urls_per_client)) as executor:
+            return [latency for latencies in executor.map(run_client, urls_per_client) for latency in latencies]
+
+    def run_asgi(self, cookies, urls_per_client):
+        async def run_client(client_urls):
+            client = AsyncClient()
+            client.cookies = cookies
+            latencies = []
+            for url in client_urls:
+                start = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - start)
+                if response.status_code != 200:
+                    raise CommandError(f"{url} returned {response.status_code}")
+            return latencies
+        async def run_clients():
+            results = await asyncio.gather(*[run_client(client_urls) for client_urls in urls_per_client])
+            return [latency for latencies in results for latency in latencies]
+        return async_to_sync(run_clients)()
+
+    def use_async_views(self, enabled):
+        """The views are picked when the url modules are imported, see `urls.read_view`"""
+        with override_settings(IMACS_ASYNC_VIEWS=enabled):
+            importlib.reload(urls)
+            importlib.reload(imacs.urls)
+        clear_url_caches()
+
+    def handle(self, *args, **options):
+        setup_test_environment() # allows the test client's host
+        task_list = get_task_list(options['task_list'])
+        login_client = Client()
+        login_client.force_login(task_list.users.first())
+        urls_per_client = [self.get_urls(task_list, options['requests']) for _ in range(options['clients'])]
+
+        overrides = {}
+        if not options['warm']:
+            overrides = {
+                'CACHES': dict(settings.CACHES, benchmark_no_cache={'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}),
+                'IMACS_CACHE_ALIAS': 'benchmark_no_cache',
+            }
+        handlers = ['wsgi', 'asgi'] if options['handler'] == 'both' else [options['handler']]
+        self.stdout.write(f"Task list {task_list.pk} '{task_list}', {options['clients']} clients x {options['requests']} requests, "
+            f"{'warm' if options['warm'] else 'no'} cache")
+        self.stdout.write(f"{'handler':<8} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        with override_settings(IMACS_SERVER_TIMING=False, IMACS_SLOW_REQUEST_MS=float('inf'), IMACS_SLOW_REQUEST_QUERIES=float('inf'), **overrides):
+            for handler in handlers:
+                self.use_async_views(handler == 'asgi')
+                try:
+                    start = time.perf_counter()
+                    run = self.run_wsgi if handler == 'wsgi' else self.run_asgi
+                    latencies = run(login_client.cookies, urls_per_client)
+                    duration = time.perf_counter() - start
+                finally:
+                    self.use_async_views(getattr(settings, 'IMACS_ASYNC_VIEWS', False))
+                quantiles = statistics.quantiles(latencies, n=20)
+                self.stdout.write(f"{handler:<8} {len(latencies)/duration:>8.1f} {1000*statistics.median(latencies):>8.1f} "
+                    f"{1000*quantiles[-1]:>8.1f} {1000*max(latencies):>8.1f}")
@@ -0,0 +1,62 @@
+import copy
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.urls import reverse
+
+from imacs_app.management.benchmarking import get_task_list
+from imacs_app.views import TaskListTodo
+
+UNCACHED_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+class Command(BaseCommand):
+    help = ("Measure the time spent rendering the template of the todo page (the queries and the cached "
+        "computations are done once beforehand), with and without the cached template loader")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--task-list', type=int, help="Id of the task list to use (default: the one with the most tasks)")
+        parser.add_argument('--tasks', type=int, default=500, help="Number of rows of the page")
+        parser.add_argument('--repeat', type=int, default=50, help="Number of renders, the median is reported")
+
+    def get_response(self, task_list, nb_tasks):
+        request = RequestFactory().get(reverse('imacs_app:task_list_todo', kwargs={'task_list_id': task_list.pk}))
+        request.user = task_list.users.first()
+        response = TaskListTodo.as_view()(request, task_list_id=task_list.pk)
+        response.context_data['tasks'] = response.context_data['tasks'][:nb_tasks]
+        response.render() # loads the lazy values of the context (e.g. the csrf token)
+        return response
+
+    def benchmark(self, response, repeat):
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response.rendered_content # renders again on each access
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    def handle(self, *args, **options):
+        task_list = get_task_list(options['task_list'])
+        response = self.get_response(task_list, options['tasks'])
+        nb_tasks = len(response.context_data['tasks'])
+        if nb_tasks < options['tasks']:
+            self.stderr.write(f"Only {nb_tasks} tasks in the task list")
+
+        uncached_templates = copy.deepcopy(settings.TEMPLATES)
+        for template_settings in uncached_templates:
+            if template_settings['BACKEND'] == 'django.template.backends.django.DjangoTemplates':
+                template_settings['APP_DIRS'] = False
+                template_settings.setdefault('OPTIONS', {})['loaders'] = UNCACHED_LOADERS
+
+        self.stdout.write(f"Task list {task_list.pk} '{task_list}', {nb_tasks} rows, {len(response.content)//1024} KB")
+        self.stdout.write(f"{'loader':<10} {'p50 ms':>8} {'mean ms':>8} {'min ms':>8}")
+        for name, templates in [('uncached', uncached_templates), ('settings', settings.TEMPLATES)]:
+            with override_settings(TEMPLATES=templates):
+                durations = self.benchmark(response, options['repeat'])
+            self.stdout.write(f"{name:<10} {1000*statistics.median(durations):>8.1f} {1000*statistics.mean(durations):>8.1f} "
+                f"{1000*min(durations):>8.1f}")
@@ -0,0 +1,106 @@
+import json
+import statistics
+import time
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+
+from imacs_app import urls
+from imacs_app.management.benchmarking import get_task_list
+from imacs_app.middleware import QueryRecorder
+from imacs_app.models import Task, TaskDone
+
+class Command(BaseCommand):
+    help = "Measure the query count, SQL time and wall time of every view of imacs_app on the current database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--task-list', type=int, help="Id of the task list to use (default: the one with the most tasks)")
+        parser.add_argument('--repeat', type=int, default=5, help="Number of requests per view, the median is reported")
+        parser.add_argument('--warm', action='store_true', help="Keep the cache between requests instead of clearing it")
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--baseline', help="Compare against the JSON output of a previous run, fail if a view makes more queries")
+
+    def get_url_kwargs(self, task_list):
+        task = Task.objects.filter(task_category__task_list=task_list).order_by('-last_done_at').first()
+        task_done = TaskDone.objects.filter(task=task).order_by('-when').first()
+        return {
+            'task_list_id': task_list.pk,
+            'task_category_id': task.task_category_id if task else None,
+            'task_id': task.pk if task else None,
+            'task_done_id': task_done.pk if task_done else None,
+            'next': 'todo',
+        }
+
+    def benchmark(self, client, user, url, repeat, warm):
+        runs = []
+        for _ in range(repeat):
+            if not warm:
+                caches['default'].clear()
+            # Some views (e.g. logout) end the session
+            client.force_login(user)
+            query_recorder = QueryRecorder()
+            with connection.execute_wrapper(query_recorder):
+                start = time.perf_counter()
+                response = client.get(url)
+                wall_time = time.perf_counter() - start
+            runs.append({
+                'status': response.status_code,
+                'queries': query_recorder.queries,
+                'sql_ms': 1000*query_recorder.time,
+                'wall_ms': 1000*wall_time,
+            })
+        return {
+            'url': url,
+            'status': runs[-1]['status'],
+            'queries': runs[-1]['queries'],
+            'sql_ms': statistics.median(run['sql_ms'] for run in runs),
+            'wall_ms': statistics.median(run['wall_ms'] for run in runs),
+        }
+
+    def handle(self, *args, **options):
+        setup_test_environment() # allows the test client's host
+        task_list = get_task_list(options['task_list'])
+        user = task_list.users.first()
+        url_kwargs = self.get_url_kwargs(task_list)
+        client = Client()
+
+        results = {}
+        for pattern in urls.urlpatterns:
+            name = f"{urls.app_name}:{pattern.name}"
+            kwargs = {key: url_kwargs[key] for key in pattern.pattern.converters}
+            if None in kwargs.values():
+                self.stderr.write(f"Skipping {name}: no object to use")
+                continue
+            results[name] = self.benchmark(client, user, reverse(name, kwargs=kwargs), options['repeat'], options['warm'])
+
+        self.stdout.write(f"Task list {task_list.pk} '{task_list}' ({Task.objects.filter(task_category__task_list=task_list).count()} tasks)")
+        self.stdout.write(f"{'view':<45} {'status':>6} {'queries':>8} {'sql ms':>9} {'wall ms':>9}")
+        for name, result in results.items():
+            self.stdout.write(f"{name:<45} {result['status']:>6} {result['queries']:>8} {result['sql_ms']:>9.1f} {result['wall_ms']:>9.1f}")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'task_list': task_list.pk, 'warm': options['warm'], 'views': results}, f, indent=2)
+
+        if options['baseline']:
+            self.compare(results, options['baseline'])
+
+    def compare(self, results, baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)['views']
+        regressions = []
+        self.stdout.write(f"\nCompared to {baseline_path}:")
+        self.stdout.write(f"{'view':<45} {'queries':>12} {'sql ms':>16} {'wall ms':>16}")
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            old = baseline[name]
+            self.stdout.write(f"{name:<45} {old['queries']:>5} -> {result['queries']:<4} {old['sql_ms']:>7.1f} -> {result['sql_ms']:<6.1f} {old['wall_ms']:>7.1f} -> {result['wall_ms']:<6.1f}")
+            if result['queries'] > old['queries']:
+                regressions.append(name)
+        if regressions:
+            raise CommandError(f"More queries than the baseline in: {', '.join(regressions)}")
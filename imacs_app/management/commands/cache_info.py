@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from imacs_app.caching import cache_info
+
+class Command(BaseCommand):
+    help = "Show the hit and miss counts of the task list cache (only meaningful with a cache shared between processes, which write their counts every IMACS_CACHE_STATS_INTERVAL seconds)"
+
+    def handle(self, *args, **options):
+        info = cache_info()
+        total = info['hits'] + info['misses']
+        ratio = info['hits']/total if total else 0
+        self.stdout.write(f"hits: {info['hits']}\nmisses: {info['misses']}\nhit ratio: {ratio:.1%}")
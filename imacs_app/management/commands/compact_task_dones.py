@@ -0,0 +1,23 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from imacs_app.models import TaskDoneRollup
+from imacs_app.rollup import compact
+
+class Command(BaseCommand):
+    help = "Fold the completions older than the retention window into per-task weekly or monthly rollups (safe to run repeatedly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retention-days', type=int, default=56, help="Completions more recent than this are kept as is")
+        parser.add_argument('--period', choices=[period for period, _ in TaskDoneRollup.PERIOD_CHOICES], default=TaskDoneRollup.WEEK)
+        parser.add_argument('--batch-size', type=int, default=100, help="Number of tasks compacted per transaction")
+
+    def handle(self, *args, **options):
+        # The weekly statistics (TaskList.minute_done_since_last_week) read the raw completions
+        if options['retention_days'] < 7:
+            raise CommandError("The retention window must be at least 7 days")
+        cutoff = timezone.now() - timedelta(days=options['retention_days'])
+        nb_folded = compact(cutoff, options['period'], options['batch_size'])
+        self.stdout.write(f"Folded {nb_folded} completions older than {cutoff:%Y-%m-%d %H:%M} into {options['period']} rollups")
@@ -0,0 +1,27 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from imacs_app.models import TaskList
+from imacs_app.transfer import FORMATS, export_lines
+
+class Command(BaseCommand):
+    help = "Export a task list with its categories, tasks and completion history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('task_list_id', type=int)
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--output', help="Output file (default: standard output)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            task_list = TaskList.objects.get(pk=options['task_list_id'])
+        except TaskList.DoesNotExist:
+            raise CommandError(f"No task list with id {options['task_list_id']}")
+        lines = export_lines(task_list, options['format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                f.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
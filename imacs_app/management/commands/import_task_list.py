@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from imacs_app.transfer import FORMATS, TransferError, import_lines
+
+class Command(BaseCommand):
+    help = "Create a task list from the output of export_task_list"
+
+    def add_arguments(self, parser):
+        parser.add_argument('file')
+        parser.add_argument('--format', choices=FORMATS, help="Default: guessed from the file extension")
+        parser.add_argument('--name', help="Name of the new task list (default: the exported name)")
+        parser.add_argument('--owner', help="Username of a user to add to the members")
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        format = options['format'] or ('csv' if options['file'].endswith('.csv') else 'ndjson')
+        owner = None
+        if options['owner']:
+            try:
+                owner = User.objects.get(username=options['owner'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['owner']}")
+        try:
+            with open(options['file'], newline='') as f:
+                task_list = import_lines(f, format, owner, options['name'], options['batch_size'])
+        except (TransferError, ValueError, KeyError) as error:
+            raise CommandError(f"Invalid export: {error}")
+        self.stdout.write(f"Created task list {task_list.pk} '{task_list}'")
@@ -0,0 +1,81 @@
+from datetime import timedelta
+from random import Random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.utils import timezone
+
+from imacs_app.models import TaskList, TaskCategory, Task, TaskDone
+
+class Command(BaseCommand):
+    help = "Generate a reproducible synthetic workload (task lists, users, tasks and completion history)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lists', type=int, default=1)
+        parser.add_argument('--users-per-list', type=int, default=3)
+        parser.add_argument('--categories', type=int, default=5, help="Categories per list")
+        parser.add_argument('--tasks', type=int, default=100, help="Tasks per list")
+        parser.add_argument('--years', type=float, default=1, help="Years of completion history")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='bench', help="Prefix of the generated names")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rng = Random(options['seed'])
+        prefix = options['prefix']
+        batch_size = options['batch_size']
+        now = timezone.now()
+        history_days = options['years']*365
+        # Hashing is slow on purpose: hash once, every generated user has the password "imacs"
+        password = make_password('imacs')
+
+        for list_index in range(options['lists']):
+            task_list = TaskList.objects.create(name=f"{prefix} list {list_index}")
+            users = []
+            for user_index in range(options['users_per_list']):
+                user, _ = User.objects.get_or_create(username=f"{prefix}_{list_index}_{user_index}", defaults={'password': password})
+                users.append(user)
+            task_list.users.add(*users)
+
+            # Not every backend sets the primary keys in bulk_create, so the rows are read back
+            TaskCategory.objects.bulk_create([
+                TaskCategory(task_list=task_list, name=f"Category {i}")
+                for i in range(options['categories'])
+            ])
+            categories = list(task_list.taskcategory_set.order_by('pk'))
+            Task.objects.bulk_create([
+                Task(
+                    task_category=rng.choice(categories),
+                    name=f"Task {i}",
+                    description=f"Description of task {i}",
+                    duration=rng.randint(1, 60),
+                    period=rng.choice([1, 2, 3, 7, 14, 30, 90, 365]),
+                    tasked_user=rng.choice(users) if rng.random() < 0.3 else None,
+                )
+                for i in range(options['tasks'])
+            ], batch_size=batch_size)
+            tasks = list(Task.objects.filter(task_category__task_list=task_list).order_by('pk'))
+
+            task_dones = []
+            nb_task_dones = 0
+            for task in tasks:
+                day = history_days*rng.random()*0.1
+                while day < history_days:
+                    when = now - timedelta(days=history_days - day)
+                    task_dones.append(TaskDone(task=task, task_list=task_list, when=when, duration=rng.choice([None, task.duration])))
+                    day += task.period*rng.uniform(0.5, 1.5)
+                if len(task_dones) >= batch_size:
+                    TaskDone.objects.bulk_create(task_dones, batch_size=batch_size)
+                    nb_task_dones += len(task_dones)
+                    task_dones = []
+            TaskDone.objects.bulk_create(task_dones, batch_size=batch_size)
+            nb_task_dones += len(task_dones)
+
+            # bulk_create bypasses TaskDone.save, which maintains Task.last_done_at
+            newest_done = TaskDone.objects.filter(task=models.OuterRef('pk')).order_by('-when').values('when')[:1]
+            Task.objects.filter(task_category__task_list=task_list).update(last_done_at=models.Subquery(newest_done))
+
+            self.stdout.write(f"Created list {task_list.pk} '{task_list}': {len(users)} users, {len(categories)} categories, {len(tasks)} tasks, {nb_task_dones} completions")
@@ -0,0 +1,146 @@
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connections, transaction
+from django.test import override_settings
+
+from imacs_app.management.benchmarking import get_task_list
+from imacs_app.models import Task, TaskDone
+
+# Database of the queries of the current worker thread
+current_alias = ContextVar('current_alias', default='default')
+
+class StressRouter:
+    def db_for_read(self, model, **hints):
+        return current_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return current_alias.get()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+def get_profiles():
+    """The SQLite settings compared, by name"""
+    pragmas = settings.IMACS_SQLITE_PRODUCTION_OPTIONS['init_command']
+    return {
+        # settings/dev.py: rollback journal, deferred transactions, the 5 s timeout of Python
+        'dev': {'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {}},
+        # the pragmas alone
+        'pragmas': {'ENGINE': 'imacs_app.backends.sqlite3', 'OPTIONS': {'init_command': pragmas}},
+        # settings/sqlite.py
+        'production': {'ENGINE': 'imacs_app.backends.sqlite3', 'OPTIONS': settings.IMACS_SQLITE_PRODUCTION_OPTIONS},
+    }
+
+class Command(BaseCommand):
+    help = ("Compare the throughput and the rate of \"database is locked\" errors of concurrent writers and readers "
+        "on copies of the SQLite database, with the settings of dev.py and with the SQLite production profile "
+        "(imacs/settings/sqlite.py)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--task-list', type=int, help="Id of the task list to use (default: the one with the most tasks)")
+        parser.add_argument('--writers', type=int, default=8, help="Number of writer threads")
+        parser.add_argument('--readers', type=int, default=4, help="Number of reader threads")
+        parser.add_argument('--duration', type=float, default=5, help="Duration of the run of each profile, in seconds")
+        parser.add_argument('--profile', choices=[*get_profiles(), 'all'], default='all')
+
+    def copy_database(self, path):
+        """Copy the default database to `path`, with the default rollback journal"""
+        source = connections['default']
+        source.ensure_connection()
+        target = sqlite3.connect(path)
+        try:
+            source.connection.backup(target)
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+
+    def write(self, task_ids):
+        """The queries of the bulk completion view, in a transaction which reads then writes"""
+        with transaction.atomic(using=current_alias.get()):
+            tasks = Task.objects.filter(pk__in=random.sample(task_ids, min(3, len(task_ids))))
+            tasks.add_task_dones([TaskDone(task=task, duration=5) for task in tasks], tasked_user=None)
+
+    def read(self, task_list):
+        """The query of the todo page"""
+        len(Task.objects.filter(task_category__task_list=task_list).by_priority())
+
+    def run_worker(self, alias, operation, deadline, results):
+        current_alias.set(alias)
+        latencies = []
+        errors = 0
+        try:
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    operation()
+                except OperationalError as error:
+                    if 'locked' not in str(error):
+                        raise
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - start)
+        finally:
+            connections[alias].close()
+        results.append((latencies, errors))
+
+    def run_profile(self, alias, task_list, task_ids, options):
+        deadline = time.monotonic() + options['duration']
+        writes, reads = [], []
+        workers = ([(lambda: self.write(task_ids), writes)]*options['writers'] +
+            [(lambda: self.read(task_list), reads)]*options['readers'])
+        threads = [threading.Thread(target=self.run_worker, args=(alias, operation, deadline, results))
+            for operation, results in workers]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.perf_counter() - start
+        return duration, writes, reads
+
+    def format_row(self, name, duration, writes, reads):
+        write_latencies = [latency for latencies, _ in writes for latency in latencies]
+        write_errors = sum(errors for _, errors in writes)
+        read_latencies = [latency for latencies, _ in reads for latency in latencies]
+        read_errors = sum(errors for _, errors in reads)
+        attempts = len(write_latencies) + write_errors
+        error_rate = 100*write_errors/attempts if attempts else 0
+        p95 = 1000*statistics.quantiles(write_latencies, n=20)[-1] if len(write_latencies) > 1 else float('nan')
+        return (f"{name:<11} {len(write_latencies)/duration:>9.1f} {error_rate:>8.1f}% {p95:>8.1f} "
+            f"{len(read_latencies)/duration:>8.1f} {read_errors:>8}")
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError("The default database is not an SQLite database")
+        task_list = get_task_list(options['task_list'], with_members=False)
+        task_ids = list(Task.objects.filter(task_category__task_list=task_list).values_list('pk', flat=True))
+        profiles = get_profiles()
+        if options['profile'] != 'all':
+            profiles = {options['profile']: profiles[options['profile']]}
+        self.stdout.write(f"Task list {task_list.pk} '{task_list}' ({len(task_ids)} tasks), {options['writers']} writers "
+            f"(bulk completions) and {options['readers']} readers (todo page) for {options['duration']} s")
+        self.stdout.write(f"{'profile':<11} {'writes/s':>9} {'locked':>9} {'p95 ms':>8} {'reads/s':>8} {'r.locked':>8}")
+        with tempfile.TemporaryDirectory() as directory, \
+                override_settings(DATABASE_ROUTERS=['imacs_app.management.commands.stress_sqlite.StressRouter']):
+            for name, profile in profiles.items():
+                alias = f'stress_{name}'
+                path = Path(directory)/f'{name}.sqlite3'
+                self.copy_database(path)
+                connections.databases[alias] = {**profile, 'NAME': path}
+                # The first connection switches the journal mode, like the first request of a deployment
+                connections[alias].ensure_connection()
+                connections[alias].close()
+                try:
+                    duration, writes, reads = self.run_profile(alias, task_list, task_ids, options)
+                finally:
+                    del connections.databases[alias]
+                self.stdout.write(self.format_row(name, duration, writes, reads))
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+class Command(BaseCommand):
+    help = ("Copy the SQLite primary database into its IMACS_READ_REPLICAS, to try the replica routing locally "
+        "(stands in for the replication of PostgreSQL, see imacs/settings/replicas.py)")
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, 'IMACS_READ_REPLICAS', [])
+        if not replicas:
+            raise CommandError("No replica configured, use the imacs.settings.replicas settings with DB_REPLICAS")
+        primary = connections['default']
+        for alias in ['default', *replicas]:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f"The {alias} database is not an SQLite database")
+        primary.ensure_connection()
+        for alias in replicas:
+            replica = connections[alias]
+            replica.ensure_connection()
+            primary.connection.backup(replica.connection)
+            self.stdout.write(f"Copied {primary.settings_dict['NAME']} to {replica.settings_dict['NAME']}")
@@ -0,0 +1,201 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.functional import SimpleLazyObject
+
+from .authentication import check_cache, get_user
+from .routers import current_routing, RequestRouting
+
+slow_request_logger = logging.getLogger('imacs_app.slow_requests')
+
+# The recorder of the current request. A context variable rather than an execute wrapper
+# on the connection of the request thread: the async views run their queries in worker
+# threads (see `views.gather_queries`), which copy the context but use their own connections.
+current_query_recorder = contextvars.ContextVar('current_query_recorder', default=None)
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_query_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+def install_query_recorder(sender, connection, **kwargs):
+    """`connection_created` receiver, installs `record_query` on every new connection"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+class QueryRecorder:
+    """Database execute wrapper counting the queries, their total time and the time per SQL statement."""
+    def __init__(self):
+        self.queries = 0
+        self.time = 0
+        self.statements = defaultdict(lambda: [0, 0]) # sql -> [count, time]
+        self.lock = threading.Lock() # the queries of a request may run in several threads
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self.lock:
+                self.queries += 1
+                self.time += duration
+                statement = self.statements[sql]
+                statement[0] += 1
+                statement[1] += duration
+
+    def worst_statements(self, n):
+        """The `n` statements with the highest total time, as (sql, count, time) triples."""
+        statements = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [(sql, count, duration) for sql, (count, duration) in statements[:n]]
+
+class RequestTimingMiddleware:
+    """Measure the queries, the view time and the template render time of each request.
+
+    The measures are sent in a Server-Timing header (unless `IMACS_SERVER_TIMING` is
+    False) and the requests slower than `IMACS_SLOW_REQUEST_MS` or making more than
+    `IMACS_SLOW_REQUEST_QUERIES` queries are logged to `imacs_app.slow_requests`.
+    Template responses are rendered after the view returns, so the time between
+    `process_template_response` and the end of the request is the render time.
+
+    It runs in both the sync (WSGI) and the async (ASGI) handlers, so that it does not
+    force the async views through a sync adapter.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Tells the handler to await this middleware
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        self.server_timing = getattr(settings, 'IMACS_SERVER_TIMING', True)
+        self.slow_request_ms = getattr(settings, 'IMACS_SLOW_REQUEST_MS', 500)
+        self.slow_request_queries = getattr(settings, 'IMACS_SLOW_REQUEST_QUERIES', 50)
+        self.slow_request_statements = getattr(settings, 'IMACS_SLOW_REQUEST_STATEMENTS', 5)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        recorder, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_query_recorder.reset(token)
+        return self.finish(request, response, recorder)
+
+    async def __acall__(self, request):
+        recorder, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_query_recorder.reset(token)
+        return self.finish(request, response, recorder)
+
+    def start(self, request):
+        request._timing_start = time.perf_counter()
+        request._timing_view_start = None
+        request._timing_view_end = None
+        recorder = QueryRecorder()
+        return recorder, current_query_recorder.set(recorder)
+
+    def finish(self, request, response, recorder):
+        end = time.perf_counter()
+
+        view_start = request._timing_view_start or request._timing_start
+        view_end = request._timing_view_end or end
+        timings = {
+            'db': 1000*recorder.time,
+            'view': 1000*(view_end - view_start),
+            'render': 1000*(end - view_end),
+            'total': 1000*(end - request._timing_start),
+        }
+        if self.server_timing:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={timings["db"]:.1f};desc="{recorder.queries} queries"',
+                f'view;dur={timings["view"]:.1f}',
+                f'render;dur={timings["render"]:.1f}',
+                f'total;dur={timings["total"]:.1f}',
+            ])
+        if timings['total'] > self.slow_request_ms or recorder.queries > self.slow_request_queries:
+            self.log_slow_request(request, response, recorder, timings)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timing_view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request._timing_view_end = time.perf_counter()
+        return response
+
+    def log_slow_request(self, request, response, recorder, timings):
+        lines = [
+            f"Slow request {request.method} {request.get_full_path()} ({response.status_code}): "
+            f"{timings['total']:.0f}ms total, {timings['view']:.0f}ms view, {timings['render']:.0f}ms render, "
+            f"{recorder.queries} queries in {timings['db']:.0f}ms"
+        ]
+        for sql, count, duration in recorder.worst_statements(self.slow_request_statements):
+            lines.append(f"  {1000*duration:.1f}ms x{count}: {sql}")
+        slow_request_logger.warning('\n'.join(lines))
+
+class ReplicaRoutingMiddleware:
+    """Let the reads of the GET and HEAD requests go to a replica, see `routers.ReplicaRouter`.
+
+    The requests which wrote set the `IMACS_REPLICA_PIN_COOKIE` cookie, and the
+    requests which carry it read from the primary.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        self.pin_cookie = getattr(settings, 'IMACS_REPLICA_PIN_COOKIE', 'imacs_primary')
+        self.pin_seconds = getattr(settings, 'IMACS_REPLICA_PIN_SECONDS', 10)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        routing, token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.finish(response, routing)
+
+    async def __acall__(self, request):
+        routing, token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.finish(response, routing)
+
+    def start(self, request):
+        use_replicas = request.method in ('GET', 'HEAD') and self.pin_cookie not in request.COOKIES
+        routing = RequestRouting(use_replicas)
+        return routing, current_routing.set(routing)
+
+    def finish(self, response, routing):
+        if routing.wrote:
+            response.set_cookie(self.pin_cookie, '1', max_age=self.pin_seconds, secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True, samesite='Lax')
+        return response
+
+class FastAuthenticationMiddleware(AuthenticationMiddleware):
+    """`AuthenticationMiddleware` reading the user from the cache when IMACS_FAST_AUTH is on, see authentication.py"""
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        check_cache()
+
+    def process_request(self, request):
+        super().process_request(request) # checks that the session middleware runs before
+        request.user = SimpleLazyObject(lambda: get_user(request))
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:20
+
+from django.db import migrations, models
+
+
+def backfill_last_done_at(apps, schema_editor):
+    Task = apps.get_model('imacs_app', 'Task')
+    TaskDone = apps.get_model('imacs_app', 'TaskDone')
+    newest_done = TaskDone.objects.filter(task=models.OuterRef('pk')).order_by('-when').values('when')[:1]
+    Task.objects.update(last_done_at=models.Subquery(newest_done))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imacs_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='last_done_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_last_done_at, migrations.RunPython.noop),
+    ]
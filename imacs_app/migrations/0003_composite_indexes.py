@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imacs_app', '0002_task_last_done_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['tasked_user', 'task_category'], name='task_user_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskdone',
+            index=models.Index(fields=['task', '-when'], name='taskdone_task_when_idx'),
+        ),
+    ]
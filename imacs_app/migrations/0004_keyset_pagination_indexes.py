@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imacs_app', '0003_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='taskdone',
+            name='taskdone_task_when_idx',
+        ),
+        migrations.AddIndex(
+            model_name='taskdone',
+            index=models.Index(fields=['task', '-when', '-id'], name='taskdone_task_when_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskdone',
+            index=models.Index(fields=['-when', '-id'], name='taskdone_when_id_idx'),
+        ),
+    ]
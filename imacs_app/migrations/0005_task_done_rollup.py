@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imacs_app', '0004_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskDoneRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('count', models.IntegerField()),
+                ('duration', models.IntegerField(default=0)),
+                ('last_done', models.DateTimeField()),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='imacs_app.task')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='taskdonerollup',
+            constraint=models.UniqueConstraint(fields=('task', 'period', 'period_start'), name='taskdonerollup_unique_period'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.25 on 2026-10-18 21:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_task_list(apps, schema_editor):
+    Task = apps.get_model('imacs_app', 'Task')
+    TaskDone = apps.get_model('imacs_app', 'TaskDone')
+    task_list = Task.objects.filter(pk=models.OuterRef('task_id')).values('task_category__task_list_id')[:1]
+    TaskDone.objects.update(task_list_id=models.Subquery(task_list))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('imacs_app', '0005_task_done_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskdone',
+            name='task_list',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='imacs_app.tasklist'),
+        ),
+        migrations.RunPython(backfill_task_list, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='taskdone',
+            name='task_list',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, to='imacs_app.tasklist'),
+        ),
+        migrations.AddIndex(
+            model_name='taskdone',
+            index=models.Index(fields=['task_list', '-when', '-id'], name='taskdone_list_when_id_idx'),
+        ),
+    ]
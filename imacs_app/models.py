@@ -1,12 +1,15 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils import timezone
-from django.urls import reverse
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from datetime import timedelta
 from random import random
 
+from .reversing import reverse_id
+
 def none_to_zero(x):
     return x if x is not None else 0
 
@@ -18,16 +21,79 @@ def compute_duration(tasks):
     result = tasks.aggregate(duration=models.Sum('duration'))
     return none_to_zero(result['duration'])
 
-class TaskList(models.Model):
+def days_since_epoch(when):
+    return when.timestamp()/24/3600
+
+class EpochDays(models.Func):
+    """Number of days (as a float) between the Unix epoch and a datetime expression."""
+    output_field = models.FloatField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='(EXTRACT(EPOCH FROM %(expressions)s) / 86400.0)', **extra_context)
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='(julianday(%(expressions)s) - 2440587.5)', **extra_context)
+    def as_mysql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='(UNIX_TIMESTAMP(%(expressions)s) / 86400.0)', **extra_context)
+
+def delete_task_dones(model, parents):
+    task_dones = TaskDone.objects.filter(**{f'{model.task_done_path}__in': parents})
+    task_dones._raw_delete(task_dones.db)
+
+class TaskDonesFirstQuerySet(models.QuerySet):
+    """Delete the completions of the deleted rows first, with a single DELETE.
+
+    Through the cascade, Django would load the TaskDone rows and run their post_delete
+    receivers (see `task_done_deleted`) one by one, for tasks which go away anyway.
+    The model names the path from TaskDone to it in `task_done_path`.
+    """
+    def delete(self):
+        with transaction.atomic(using=self.db, savepoint=False):
+            delete_task_dones(self.model, self)
+            return super().delete()
+
+class TaskDonesFirstMixin:
+    """`TaskDonesFirstQuerySet.delete` for the instances"""
+    def delete(self, using=None, keep_parents=False):
+        with transaction.atomic(using=using, savepoint=False):
+            delete_task_dones(type(self), [self.pk])
+            return super().delete(using, keep_parents)
+
+class TaskQuerySet(TaskDonesFirstQuerySet):
+    def with_priority(self, now=None):
+        """Annotate `annotated_priority`, the SQL counterpart of `Task.priority` (NULL when never done)."""
+        if now is None:
+            now = timezone.now()
+        priority = (models.Value(days_since_epoch(now)) - EpochDays('last_done_at'))/models.F('period')
+        return self.annotate(annotated_priority=models.ExpressionWrapper(priority, output_field=models.FloatField()))
+
+    def add_task_dones(self, task_dones, **fields):
+        """Insert completions of the tasks of this queryset and update them with a single UPDATE.
+
+        `bulk_create` bypasses `TaskDone.save`, so `last_done_at` is recomputed here, along
+        with the other `fields` to set (e.g. `tasked_user`). Returns the number of updated tasks.
+        """
+        TaskDone.objects.bulk_create(task_dones)
+        newest_done = TaskDone.objects.filter(task=models.OuterRef('pk')).order_by('-when').values('when')[:1]
+        return self.update(last_done_at=models.Subquery(newest_done), **fields)
+
+    def by_priority(self, now=None):
+        return (self.with_priority(now)
+            .select_related('task_category', 'tasked_user')
+            .order_by(models.F('annotated_priority').desc(nulls_first=True), 'pk'))
+
+class TaskList(TaskDonesFirstMixin, models.Model):
     name = models.CharField(max_length=200)
     users = models.ManyToManyField(User)
 
+    objects = TaskDonesFirstQuerySet.as_manager()
+    task_done_path = 'task_list'
+
     def __str__(self):
         return self.name
     def get_name(self):
         return self.name
     def get_absolute_url(self):
-        return reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.pk})
+        return reverse_id('imacs_app:task_list_todo', self.pk)
 
     def minute_per_day(self):
         return compute_minute_per_day(Task.objects.filter(task_category__task_list = self))
@@ -52,27 +118,79 @@ class TaskList(models.Model):
     def minutes_for_user(self, user):
         return compute_duration(Task.objects.filter(task_category__task_list = self, tasked_user = user))
 
-class TaskCategory(models.Model):
+    def stats(self):
+        return TaskListStats(self)
+
+class TaskListStats:
+    """All the numbers of the todo page header, computed with one grouped query (plus the members).
+
+    A task counts as done since last week if it was completed at least once in the last 7 days,
+    like in `TaskList.minute_done_since`.
+    """
+    def __init__(self, task_list, now=None):
+        if now is None:
+            now = timezone.now()
+        since = now - timedelta(days=7)
+        rows = (Task.objects.filter(task_category__task_list = task_list)
+            .order_by()
+            .values('tasked_user')
+            .annotate(
+                minute_per_day=models.Sum((1.0*models.F('duration'))/models.F('period')),
+                minute_done=models.Sum('duration', filter=models.Q(last_done_at__gte=since)),
+                minute_tasked=models.Sum('duration'),
+            ))
+        minutes_per_user = {}
+        minute_per_day = 0
+        minute_done = 0
+        for row in rows:
+            minute_per_day += none_to_zero(row['minute_per_day'])
+            minute_done += none_to_zero(row['minute_done'])
+            minutes_per_user[row['tasked_user']] = none_to_zero(row['minute_tasked'])
+
+        self.users = list(task_list.users.all())
+        self.minute_per_day = minute_per_day
+        self.hour_per_week = minute_per_day*7/60
+        self.hour_done_since_last_week = minute_done/60
+        self.remaining_hours_this_week = max(0, self.hour_per_week - self.hour_done_since_last_week)
+        self.hour_per_week_per_user = self.hour_per_week/len(self.users) if self.users else 0
+        self.hours_per_user = [(user, minutes_per_user.get(user.pk, 0)/60) for user in self.users]
+
+class TaskCategory(TaskDonesFirstMixin, models.Model):
     task_list = models.ForeignKey(TaskList, on_delete=models.CASCADE)
     name = models.CharField(max_length=200)
 
+    objects = TaskDonesFirstQuerySet.as_manager()
+    task_done_path = 'task__task_category'
+
     def __str__(self):
         return str(self.task_list) + "/" + self.name
     def get_name(self):
         return self.name
     def get_absolute_url(self):
-        return reverse('imacs_app:task_category_modify', kwargs={'task_category_id': self.pk})
+        return reverse_id('imacs_app:task_category_modify', self.pk)
 
     def minute_per_day(self):
+        if 'task_set' in getattr(self, '_prefetched_objects_cache', {}):
+            return sum(task.duration/task.period for task in self.task_set.all())
         return compute_minute_per_day(self.task_set)
 
-class Task(models.Model):
+class Task(TaskDonesFirstMixin, models.Model):
     task_category = models.ForeignKey(TaskCategory, on_delete=models.CASCADE)
     name = models.CharField(max_length=200)
     description = models.TextField()
     duration = models.IntegerField(validators=[MinValueValidator(0)]) # in minutes
     period = models.IntegerField(validators=[MinValueValidator(1)]) # in days
     tasked_user = models.ForeignKey(User, null=True, on_delete=models.SET_NULL)
+    last_done_at = models.DateTimeField(null=True, blank=True, editable=False) # denormalized from TaskDone, see `task_done_saved`
+
+    objects = TaskQuerySet.as_manager()
+    task_done_path = 'task'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tasked_user', 'task_category'], name='task_user_category_idx'),
+        ]
+
     def clean(self):
         if self.tasked_user:
             if self.tasked_user not in self.task_category.task_list.users.all():
@@ -83,25 +201,120 @@ class Task(models.Model):
     def get_name(self):
         return self.name
     def get_absolute_url(self):
-        return reverse('imacs_app:task_modify', kwargs={'task_id': self.pk})
+        return reverse_id('imacs_app:task_modify', self.pk)
 
     def get_random_taskdone(self):
         return TaskDone(task=self, when = timezone.now() - timedelta(days=random()*self.period))
 
+    def update_last_done(self):
+        last_done_ats = [
+            self.taskdone_set.aggregate(last_done_at=models.Max('when'))['last_done_at'],
+            self.taskdonerollup_set.aggregate(last_done_at=models.Max('last_done'))['last_done_at'],
+        ]
+        self.last_done_at = max((x for x in last_done_ats if x is not None), default=None)
+        Task.objects.filter(pk=self.pk).update(last_done_at=self.last_done_at)
+
     def last_done(self):
-        try:
-            return self.taskdone_set.order_by('-when')[0].when
-        except IndexError:
-            return None
+        return self.last_done_at
     def priority(self):
-        last_done = self.last_done()
+        if hasattr(self, 'annotated_priority'):
+            return self.annotated_priority if self.annotated_priority is not None else float("inf")
+        last_done = self.last_done_at
         if last_done == None:
             return float("inf")
         else:
             delta = timezone.now()-last_done
             return (delta.days + (delta.seconds/24/3600))/self.period
 
+class TaskDoneQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """Fill the `task_list` of the completions from their task, with one query"""
+        objs = list(objs)
+        task_ids = {task_done.task_id for task_done in objs if task_done.task_list_id is None}
+        if task_ids:
+            task_list_ids = dict(Task.objects.filter(pk__in=task_ids).values_list('pk', 'task_category__task_list_id'))
+            for task_done in objs:
+                if task_done.task_list_id is None:
+                    task_done.task_list_id = task_list_ids.get(task_done.task_id)
+        return super().bulk_create(objs, *args, **kwargs)
+
 class TaskDone(models.Model):
     task = models.ForeignKey(Task, on_delete=models.CASCADE)
+    # Denormalized from the task, for the pages of a whole task list: the categories of a task
+    # stay in its list. Indexed by taskdone_list_when_id_idx
+    task_list = models.ForeignKey(TaskList, on_delete=models.CASCADE, editable=False, db_index=False)
     when = models.DateTimeField(default=timezone.now)
     duration = models.IntegerField(validators=[MinValueValidator(0)], blank=True, null=True) # in minutes
+
+    objects = TaskDoneQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination (see pagination.py) seeks on (when, id)
+            models.Index(fields=['task', '-when', '-id'], name='taskdone_task_when_id_idx'),
+            models.Index(fields=['task_list', '-when', '-id'], name='taskdone_list_when_id_idx'),
+            models.Index(fields=['-when', '-id'], name='taskdone_when_id_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.task_list_id is None:
+            self.task_list_id = Task.objects.filter(pk=self.task_id).values_list('task_category__task_list_id', flat=True).get()
+        super().save(*args, **kwargs)
+
+# Task.last_done_at follows the TaskDone rows through signals, which unlike overrides of
+# save and delete also fire for the deletions of querysets (e.g. in the admin).
+# Bulk inserts send none, see `TaskQuerySet.add_task_dones`.
+
+@receiver(post_save, sender=TaskDone)
+def task_done_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        newer = models.Q(last_done_at__isnull=True) | models.Q(last_done_at__lt=instance.when)
+        Task.objects.filter(newer, pk=instance.task_id).update(last_done_at=instance.when)
+    else:
+        instance.task.update_last_done()
+
+@receiver(post_delete, sender=TaskDone)
+def task_done_deleted(sender, instance, **kwargs):
+    # Only the newest completion is stored on the task
+    task = Task.objects.filter(pk=instance.task_id, last_done_at=instance.when).first()
+    if task is not None:
+        task.update_last_done()
+
+def get_task_list_id(instance):
+    """Id of the task list of a Task (None once it is deleted) or a TaskDone.
+
+    Looked up once per task and category: the receivers of a signal (the cache
+    versions, the live updates) share it. A TaskDone carries it.
+    """
+    if isinstance(instance, TaskDone):
+        return instance.task_list_id
+    parent_id = instance.task_category_id
+    task_list_ids = TaskCategory.objects.filter(pk=parent_id).values_list('task_list_id', flat=True)
+    cached = getattr(instance, '_task_list_id', None)
+    if cached is None or cached[0] != parent_id:
+        cached = instance._task_list_id = (parent_id, task_list_ids.first())
+    return cached[1]
+
+class TaskDoneRollup(models.Model):
+    """Summary of the completions of a task during a week or a month.
+
+    The `compact_task_dones` command folds the old TaskDone rows into these, so that
+    the TaskDone table only keeps the recent history.
+    """
+    WEEK = 'week'
+    MONTH = 'month'
+    PERIOD_CHOICES = [(WEEK, 'Week'), (MONTH, 'Month')]
+
+    task = models.ForeignKey(Task, on_delete=models.CASCADE)
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    count = models.IntegerField()
+    duration = models.IntegerField(default=0) # sum of the known durations, in minutes
+    last_done = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'period', 'period_start'], name='taskdonerollup_unique_period'),
+        ]
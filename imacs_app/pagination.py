@@ -0,0 +1,41 @@
+"""Keyset (seek) pagination of completions, newest first.
+
+A page starts after a cursor encoding the `(when, id)` of the last row of the
+previous page, so fetching any page reads `page_size` rows of an index on
+`(..., -when, -id)` (taskdone_task_when_id_idx for a task,
+taskdone_list_when_id_idx for a task list) instead of an OFFSET skipping all
+the previous pages.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from django.core.exceptions import SuspiciousOperation
+from django.db.models import Q
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def encode_cursor(obj, field='when'):
+    microseconds = (getattr(obj, field) - EPOCH)//timedelta(microseconds=1)
+    return f"{microseconds}_{obj.pk}"
+
+def decode_cursor(cursor):
+    try:
+        microseconds, pk = cursor.split('_')
+        return EPOCH + timedelta(microseconds=int(microseconds)), int(pk)
+    except (ValueError, OverflowError):
+        raise SuspiciousOperation(f"Invalid cursor {cursor}")
+
+def get_page(queryset, cursor, page_size, field='when'):
+    """Return the rows after `cursor` (None for the first page) and the cursor of the next page (None for the last one).
+
+    The rows are ordered by the datetime `field` then the id, newest first (e.g. the
+    TaskDoneRollup rows on `last_done`).
+    """
+    queryset = queryset.order_by(f'-{field}', '-pk')
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+    page = list(queryset[:page_size + 1])
+    if len(page) > page_size:
+        return page[:page_size], encode_cursor(page[page_size - 1], field)
+    return page, None
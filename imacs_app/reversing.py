@@ -0,0 +1,31 @@
+"""Memoized `reverse` for the urls of an object, which only vary by its id.
+
+The rows of the todo page link every task to four views, and reversing them was
+about half of the rendering time of the page. `reverse_id` reverses each view
+once with a placeholder id, then only puts the id in place of the placeholder.
+"""
+
+from functools import lru_cache
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import reverse, get_script_prefix, get_urlconf
+
+PLACEHOLDER = 9876543210123 # only digits, for the int converters
+
+@lru_cache(maxsize=None)
+def _url_parts(viewname, args, urlconf, prefix):
+    return reverse(viewname, urlconf=urlconf, args=[PLACEHOLDER, *args]).split(str(PLACEHOLDER))
+
+def url_parts(viewname, args=()):
+    """The url of `viewname` for the other arguments `args`, split around the id"""
+    return _url_parts(viewname, tuple(args), get_urlconf(), get_script_prefix())
+
+def reverse_id(viewname, object_id, *args):
+    """Same as `reverse(viewname, args=[object_id, *args])`, for the views whose first argument is an int id"""
+    return str(int(object_id)).join(url_parts(viewname, args))
+
+@receiver(setting_changed)
+def reset_url_parts(setting, **kwargs):
+    if setting == 'ROOT_URLCONF':
+        _url_parts.cache_clear()
@@ -0,0 +1,73 @@
+"""Compaction of the old TaskDone rows into TaskDoneRollup rows.
+
+Compacting is idempotent: the rows older than the cutoff are folded into the
+rollup of their task and period (adding to an existing rollup if there is one)
+and deleted in the same transaction, so running it again only folds the rows
+which became old in the meantime.
+"""
+
+from django.db import models, transaction
+from django.db.models.functions import TruncWeek, TruncMonth
+
+from .models import Task, TaskDone, TaskDoneRollup
+from .caching import bump_version
+
+TRUNCATE = {
+    TaskDoneRollup.WEEK: TruncWeek,
+    TaskDoneRollup.MONTH: TruncMonth,
+}
+
+def compact_tasks(task_ids, cutoff, period):
+    """Fold the completions of the given tasks older than `cutoff`, return the number of folded completions"""
+    task_dones = TaskDone.objects.filter(task_id__in=task_ids, when__lt=cutoff)
+    summaries = (task_dones
+        .annotate(period_start=TRUNCATE[period]('when', output_field=models.DateField()))
+        .order_by()
+        .values('task_id', 'period_start')
+        .annotate(count=models.Count('pk'), duration=models.Sum('duration'), last_done=models.Max('when')))
+
+    rollups = {
+        (rollup.task_id, rollup.period_start): rollup
+        for rollup in TaskDoneRollup.objects.filter(task_id__in=task_ids, period=period)
+    }
+    new_rollups = []
+    updated_rollups = []
+    nb_folded = 0
+    for summary in summaries:
+        nb_folded += summary['count']
+        duration = summary['duration'] or 0
+        rollup = rollups.get((summary['task_id'], summary['period_start']))
+        if rollup is None:
+            new_rollups.append(TaskDoneRollup(
+                task_id=summary['task_id'],
+                period=period,
+                period_start=summary['period_start'],
+                count=summary['count'],
+                duration=duration,
+                last_done=summary['last_done'],
+            ))
+        else:
+            rollup.count += summary['count']
+            rollup.duration += duration
+            rollup.last_done = max(rollup.last_done, summary['last_done'])
+            updated_rollups.append(rollup)
+    TaskDoneRollup.objects.bulk_create(new_rollups)
+    TaskDoneRollup.objects.bulk_update(updated_rollups, ['count', 'duration', 'last_done'])
+    # A single DELETE: with the post_delete receivers of TaskDone, delete() would go
+    # through the rows one by one. Task.last_done_at stays valid, the newest folded
+    # completion is kept in the rollup, and `compact` bumps the cache versions.
+    task_dones._raw_delete(task_dones.db)
+    return nb_folded
+
+def compact(cutoff, period=TaskDoneRollup.WEEK, batch_size=100):
+    """Fold the completions older than `cutoff` into rollups, `batch_size` tasks per transaction"""
+    task_ids = list(TaskDone.objects.filter(when__lt=cutoff).order_by('task_id').values_list('task_id', flat=True).distinct())
+    nb_folded = 0
+    for i in range(0, len(task_ids), batch_size):
+        batch = task_ids[i:i + batch_size]
+        with transaction.atomic():
+            nb_folded += compact_tasks(batch, cutoff, period)
+        task_list_ids = Task.objects.filter(pk__in=batch).values_list('task_category__task_list_id', flat=True).distinct()
+        for task_list_id in task_list_ids:
+            bump_version(task_list_id)
+    return nb_folded
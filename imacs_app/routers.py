@@ -0,0 +1,59 @@
+"""Routing of the reads of the read-only requests to replicas of the database.
+
+Enabled by the imacs/settings/replicas.py layer. The reads of the GET and HEAD
+requests, scoped by `middleware.ReplicaRoutingMiddleware`, go to one of the
+`IMACS_READ_REPLICAS` (picked once per request, so that its reads are consistent).
+Everything else (the other methods, the commands, the events stream) uses the
+primary. For read-your-writes consistency:
+- the first write of a request sends its next reads to the primary,
+- a request which wrote pins the next requests of the browser to the primary for
+  `IMACS_REPLICA_PIN_SECONDS` (a cookie), which must exceed the replication lag.
+
+The other members may still read from a replica lagging behind a change, and cache
+the pages computed from it (see caching.py) until the cache period ends.
+"""
+
+import contextvars
+import random
+
+from django.conf import settings
+
+# A context variable, like `middleware.current_query_recorder`: the async views run
+# their queries in worker threads, which copy the context
+current_routing = contextvars.ContextVar('current_routing', default=None)
+
+def get_replicas():
+    return getattr(settings, 'IMACS_READ_REPLICAS', [])
+
+class RequestRouting:
+    """Database of the reads of a request, None for the primary"""
+    def __init__(self, use_replicas):
+        replicas = get_replicas()
+        self.replica = random.choice(replicas) if use_replicas and replicas else None
+        self.wrote = False
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = current_routing.get()
+        if routing is None or routing.wrote or routing.replica is None:
+            return 'default'
+        return routing.replica
+
+    def db_for_write(self, model, **hints):
+        routing = current_routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary
+        databases = {'default', *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replicas get the schema from the primary
+        if db in get_replicas():
+            return False
+        return None
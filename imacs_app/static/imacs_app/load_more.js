@@ -0,0 +1,23 @@
+// "Load more" buttons: <a data-load-more="id of the container" href="?after=cursor">
+// The next rows are fetched as a fragment and appended to the container, the
+// cursor of the following page comes in the X-Next-Cursor header.
+document.querySelectorAll('[data-load-more]').forEach(function (button) {
+    button.addEventListener('click', function (event) {
+        event.preventDefault();
+        const url = new URL(button.href);
+        url.searchParams.set('fragment', 'rows');
+        fetch(url).then(function (response) {
+            return response.text().then(function (html) {
+                document.getElementById(button.dataset.loadMore).insertAdjacentHTML('beforeend', html);
+                const nextCursor = response.headers.get('X-Next-Cursor');
+                if (nextCursor) {
+                    const nextUrl = new URL(button.href);
+                    nextUrl.searchParams.set('after', nextCursor);
+                    button.href = nextUrl;
+                } else {
+                    button.remove();
+                }
+            });
+        });
+    });
+});
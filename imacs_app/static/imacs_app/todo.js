@@ -0,0 +1,106 @@
+// Todo page: the forms of the rows marked with data-fragment ("C'est fait !" and
+// "Task me") are posted with ?fragment=row, and the answer (the updated row and
+// stats, see TodoFragmentMixin) replaces them instead of reloading the page.
+// With <table data-events="url of the events of the task list">, the changes made
+// by the other members are also applied live (see imacs_app/events.py).
+(function () {
+    const rows = document.getElementById('todo-rows');
+    const table = rows.closest('table');
+
+    function rank(row) {
+        const priority = parseFloat(row.dataset.priority);
+        return isNaN(priority) ? Infinity : priority; // never done
+    }
+
+    function sortRows() {
+        const sorted = Array.from(rows.querySelectorAll('tr[data-task-id]'));
+        sorted.sort(function (a, b) {
+            return rank(b) - rank(a) || a.dataset.taskId - b.dataset.taskId;
+        });
+        sorted.forEach(function (row) {
+            rows.appendChild(row);
+        });
+    }
+
+    function findRow(id) {
+        return rows.querySelector('tr[data-task-id="' + id + '"]');
+    }
+
+    rows.addEventListener('submit', function (event) {
+        const form = event.target;
+        if (!('fragment' in form.dataset)) {
+            return;
+        }
+        event.preventDefault();
+        const url = new URL(form.action);
+        url.searchParams.set('fragment', 'row');
+        fetch(url, {method: 'POST', body: new FormData(form)}).then(function (response) {
+            if (!response.ok) {
+                form.submit(); // shows the errors
+                return;
+            }
+            return response.text().then(function (html) {
+                const update = document.createElement('template');
+                update.innerHTML = html;
+                document.getElementById('todo-stats').replaceWith(update.content.getElementById('todo-stats'));
+                const row = update.content.querySelector('tr[data-task-id]');
+                const oldRow = findRow(row.dataset.taskId);
+                if (oldRow) {
+                    oldRow.replaceWith(row);
+                }
+                sortRows();
+            });
+        });
+    });
+
+    if (!table.dataset.events) {
+        return;
+    }
+
+    const taskMeForm = document.getElementById('task-me-form');
+
+    function priorityClass(priority) {
+        if (priority >= 1.5) {
+            return 'is-danger';
+        }
+        return priority >= 1 ? 'is-warning' : 'is-success';
+    }
+
+    function patchRow(row, task) {
+        const priority = task.priority === null ? Infinity : task.priority;
+        row.dataset.priority = priority;
+        const priorityCell = row.querySelector('[data-field="priority"]');
+        priorityCell.textContent = task.priority === null ? 'inf' : task.priority.toFixed(2);
+        priorityCell.className = priorityClass(priority);
+        const taskedUserCell = row.querySelector('[data-field="tasked_user"]');
+        if (task.tasked_user) {
+            taskedUserCell.textContent = task.tasked_user;
+        } else if (!taskedUserCell.querySelector('form')) {
+            const form = taskMeForm.content.cloneNode(true);
+            const action = form.querySelector('form').getAttribute('action');
+            form.querySelector('form').setAttribute('action', action.replace('/0/', '/' + task.id + '/'));
+            taskedUserCell.replaceChildren(form);
+        }
+    }
+
+    const source = new EventSource(table.dataset.events);
+    source.addEventListener('tasks', function (event) {
+        const data = JSON.parse(event.data);
+        data.removed.forEach(function (id) {
+            const row = findRow(id);
+            if (row) {
+                row.remove();
+            }
+        });
+        data.tasks.forEach(function (task) {
+            const row = findRow(task.id);
+            if (row) { // the new tasks show up on the next load
+                patchRow(row, task);
+            }
+        });
+        sortRows();
+    });
+    source.addEventListener('reload', function () {
+        window.location.reload();
+    });
+})();
@@ -0,0 +1,173 @@
+"""Static files storage of the deployments, used by `collectstatic`.
+
+On top of `ManifestStaticFilesStorage` (content-hashed names, which nginx serves
+with immutable cache headers, see module.nix):
+- the rules of the `IMACS_PURGED_CSS` stylesheets (Bulma) whose selectors use a
+  class never written in the sources of the app (templates, scripts, template
+  tags) are removed before hashing,
+- every text file gets precompressed `.gz` and `.br` siblings, for the
+  `gzip_static` and `brotli_static` modules of nginx. The `.br` files are only
+  written when the `brotli` package is installed.
+"""
+
+import gzip
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+APP_DIR = Path(__file__).resolve().parent
+SOURCE_DIRS = [APP_DIR/'templates', APP_DIR/'static', APP_DIR/'templatetags']
+SOURCE_SUFFIXES = {'.html', '.js', '.py'}
+
+WORD_RE = re.compile(r'[\w-]+')
+CLASS_RE = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+NOT_RE = re.compile(r':not\([^)]*\)')
+
+def source_words():
+    """Every word of the sources of the app, a superset of the classes it uses"""
+    words = set()
+    for source_dir in SOURCE_DIRS:
+        for path in source_dir.rglob('*'):
+            if path.suffix in SOURCE_SUFFIXES and path.is_file():
+                words.update(WORD_RE.findall(path.read_text(errors='ignore')))
+    return words
+
+def find_block_end(css, start):
+    """Index of the '}' closing the block opened just before `start`"""
+    depth = 1
+    i = start
+    while i < len(css):
+        char = css[i]
+        if char in '"\'':
+            i = css.index(char, i + 1)
+        elif css.startswith('/*', i):
+            i = css.index('*/', i) + 1
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise ValueError("Unbalanced braces in CSS")
+
+def split_selectors(prelude):
+    """Split a selector list on the commas which are not inside parentheses"""
+    selectors = []
+    depth = 0
+    start = 0
+    for i, char in enumerate(prelude):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(prelude[start:i])
+            start = i + 1
+    selectors.append(prelude[start:])
+    return [selector.strip() for selector in selectors]
+
+def is_used(selector, words):
+    # `.a:not(.b)` matches without `.b`
+    return all(name in words for name in CLASS_RE.findall(NOT_RE.sub('', selector)))
+
+def purge_css(css, words):
+    """Remove the selectors of `css` using a class not in `words`, and the rules left without selector.
+
+    The at-rules other than @media and @supports (e.g. @keyframes) are kept as is,
+    and so are the /*! comments (licenses).
+    """
+    out = []
+    i = 0
+    while i < len(css):
+        if css[i].isspace():
+            i += 1
+            continue
+        if css.startswith('/*', i):
+            end = css.index('*/', i) + 2
+            if css.startswith('/*!', i):
+                out.append(css[i:end])
+            i = end
+            continue
+        brace = css.find('{', i)
+        semicolon = css.find(';', i)
+        if brace == -1 or (semicolon != -1 and semicolon < brace):
+            # Statement at-rule, e.g. @charset or @import
+            end = len(css) if semicolon == -1 else semicolon + 1
+            out.append(css[i:end])
+            i = end
+            continue
+        end = find_block_end(css, brace + 1)
+        prelude = css[i:brace].strip()
+        body = css[brace + 1:end]
+        i = end + 1
+        if prelude.startswith(('@media', '@supports')):
+            body = purge_css(body, words)
+            if body:
+                out.append(f'{prelude}{{{body}}}')
+        elif prelude.startswith('@'):
+            out.append(f'{prelude}{{{body}}}')
+        else:
+            selectors = [selector for selector in split_selectors(prelude) if is_used(selector, words)]
+            if selectors:
+                out.append(f"{','.join(selectors)}{{{body}}}")
+    return ''.join(out)
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    compressed_extensions = ('.css', '.js', '.json', '.svg', '.txt', '.map')
+    min_compressed_size = 256 # bytes, smaller files are not worth a second lookup
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            paths = dict(paths)
+            for name in getattr(settings, 'IMACS_PURGED_CSS', []):
+                if name in paths:
+                    self.purge(name, *paths[name])
+                    # The hashed copy is made from the source file, make it from the purged one
+                    paths[name] = (self, name)
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Both the original and the hashed names, the templates only use the latter
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if not name.endswith(self.compressed_extensions) or not self.exists(name):
+                continue
+            with self.open(name) as original:
+                data = original.read()
+            if len(data) < self.min_compressed_size:
+                continue
+            for compressed_name in self.compress(name, data):
+                yield name, compressed_name, True
+
+    def purge(self, name, source_storage, source_path):
+        with source_storage.open(source_path) as source:
+            css = source.read().decode()
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(purge_css(css, source_words()).encode()))
+
+    def compress(self, name, data):
+        """Write the compressed siblings of `name`, and return their names"""
+        compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            compressors.append(('.br', lambda data: brotli.compress(data, mode=brotli.MODE_TEXT)))
+        compressed_names = []
+        for suffix, compress in compressors:
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue
+            compressed_name = name + suffix
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            self._save(compressed_name, ContentFile(compressed))
+            compressed_names.append(compressed_name)
+        return compressed_names
@@ -21,6 +21,10 @@ def is_input(field):
         forms.URLInput
     ))
 
+@register.filter
+def is_file(field):
+    return isinstance(field.field.widget, forms.FileInput)
+
 @register.filter
 def is_checkbox(field):
     return isinstance(field.field.widget, (
@@ -1,3 +1,1305 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import gzip
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import datetime, time, timedelta
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import patch
+from urllib.parse import urlencode
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.signals import request_started, request_finished
+from django.db import close_old_connections, connection, connections
+from django.db.models import Count, Max, Q
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, AsyncClient, AsyncRequestFactory, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, set_script_prefix
+from django.utils import timezone
+
+from .models import TaskList, TaskCategory, Task, TaskDone, TaskDoneRollup
+from .caching import HITS_KEY, cache_info, flush_counts, is_shared_cache
+from .backends.sqlite3 import base as sqlite_backend
+from . import asgi, assignment, events, forecast, middleware, reversing, rollup, routers, storage, transfer, views
+
+def create_task_list(user, nb_tasks, nb_done_per_task=2):
+    task_list = TaskList.objects.create(name="Maison")
+    task_list.users.add(user)
+    task_category = TaskCategory.objects.create(task_list=task_list, name="Cuisine")
+    now = timezone.now()
+    for i in range(nb_tasks):
+        task = Task.objects.create(task_category=task_category, name=f"Task {i}", description="", duration=10+i, period=1+i%7, tasked_user=user if i%2 == 0 else None)
+        for j in range(nb_done_per_task if i%5 != 0 else 0):
+            TaskDone.objects.create(task=task, when=now - timedelta(days=j+i%3, hours=i), duration=5)
+    return task_list
+
+class ImacsTestMixin:
+    """alice, logged in, and her task list `task_list` of `nb_tasks` tasks (see `create_task_list`).
+
+    `nb_tasks = None` for no task list.
+    """
+    nb_tasks = 10
+    nb_done_per_task = 2
+
+    def setUp(self):
+        super().setUp()
+        # Primary keys are reused between tests, so cached pages (and hit counts) must not leak
+        flush_counts()
+        cache.clear()
+        self.user = User.objects.create_user("alice", password="alice")
+        if self.nb_tasks is not None:
+            self.task_list = create_task_list(self.user, self.nb_tasks, self.nb_done_per_task)
+        self.client.force_login(self.user)
+
+class ImacsTestCase(ImacsTestMixin, TestCase):
+    pass
+
+class ImacsTransactionTestCase(ImacsTestMixin, TransactionTestCase):
+    pass
+
+class TaskPriorityTests(ImacsTestCase):
+    nb_tasks = 20
+
+    def test_sql_priority_matches_python_priority(self):
+        now = timezone.now()
+        tasks = list(Task.objects.filter(task_category__task_list=self.task_list).by_priority(now))
+        for task in tasks:
+            last_done = task.taskdone_set.aggregate(last_done=Max('when'))['last_done']
+            self.assertEqual(task.last_done(), last_done)
+            if last_done is None:
+                self.assertEqual(task.priority(), float("inf"))
+            else:
+                delta = now - last_done
+                self.assertAlmostEqual(task.priority(), (delta.days + delta.seconds/24/3600)/task.period, places=4)
+        priorities = [task.priority() for task in tasks]
+        self.assertEqual(priorities, sorted(priorities, reverse=True))
+
+class TaskListStatsTests(ImacsTestCase):
+    nb_tasks = 30
+
+    def test_stats_match_task_list_methods(self):
+        task_list = self.task_list
+        bob = User.objects.create_user("bob", password="bob")
+        task_list.users.add(bob)
+        Task.objects.filter(pk__in=Task.objects.filter(tasked_user=None).values('pk')[:3]).update(tasked_user=bob)
+        with self.assertNumQueries(2):
+            stats = task_list.stats()
+        self.assertAlmostEqual(stats.hour_per_week, task_list.hour_per_week())
+        self.assertAlmostEqual(stats.hour_done_since_last_week, task_list.hour_done_since_last_week())
+        self.assertAlmostEqual(stats.remaining_hours_this_week, task_list.remaining_hours_this_week())
+        self.assertAlmostEqual(stats.hour_per_week_per_user, task_list.hour_per_week_per_user())
+        for user, hours in stats.hours_per_user:
+            self.assertEqual(hours, task_list.minutes_for_user(user)/60)
+
+class TaskLastDoneTests(ImacsTestCase):
+    nb_tasks = 1
+    nb_done_per_task = 0
+
+    def setUp(self):
+        super().setUp()
+        self.task = self.task_list.taskcategory_set.get().task_set.get()
+
+    def test_last_done_follows_task_done_writes(self):
+        now = timezone.now()
+        old = TaskDone.objects.create(task=self.task, when=now - timedelta(days=3))
+        newest = TaskDone.objects.create(task=self.task, when=now)
+        TaskDone.objects.create(task=self.task, when=now - timedelta(days=1))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.last_done_at, now)
+
+        newest.delete()
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.last_done_at, now - timedelta(days=1))
+
+        old.when = now + timedelta(hours=1)
+        old.save()
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.last_done_at, now + timedelta(hours=1))
+
+    def test_last_done_follows_queryset_deletes(self):
+        now = timezone.now()
+        for days in range(4):
+            TaskDone.objects.create(task=self.task, when=now - timedelta(days=days))
+        TaskDone.objects.filter(task=self.task, when__gt=now - timedelta(days=2)).delete()
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.last_done_at, now - timedelta(days=2))
+
+        self.task.taskdone_set.all().delete()
+        self.task.refresh_from_db()
+        self.assertIsNone(self.task.last_done_at)
+
+    def test_task_list_of_completions(self):
+        created = TaskDone.objects.create(task=self.task)
+        bulk_created, = TaskDone.objects.bulk_create([TaskDone(task=self.task)])
+        self.assertEqual(created.task_list_id, self.task.task_category.task_list_id)
+        self.assertEqual(bulk_created.task_list_id, self.task.task_category.task_list_id)
+
+    def test_delete_with_history(self):
+        # The completions go in a single DELETE, not through their post_delete receivers one by one
+        def nb_queries(delete, nb_done):
+            task = create_task_list(self.user, 1, 0).taskcategory_set.select_related('task_list').get().task_set.select_related('task_category__task_list').get()
+            TaskDone.objects.bulk_create([TaskDone(task=task, when=timezone.now() - timedelta(minutes=i)) for i in range(nb_done)])
+            with CaptureQueriesContext(connection) as queries:
+                delete(task)
+            self.assertFalse(TaskDone.objects.filter(task_id=task.pk).exists())
+            return len(queries)
+        deletes = {
+            'task': (lambda task: task.delete(), 5),
+            'tasks': (lambda task: Task.objects.filter(pk=task.pk).delete(), 6),
+            'category': (lambda task: task.task_category.delete(), 7),
+            'task list': (lambda task: task.task_category.task_list.delete(), 12),
+        }
+        for name, (delete, max_queries) in deletes.items():
+            with self.subTest(name):
+                self.assertEqual(nb_queries(delete, 500), nb_queries(delete, 5))
+                self.assertLessEqual(nb_queries(delete, 5), max_queries)
+
+    def test_done_now_view_updates_last_done(self):
+        url = reverse('imacs_app:task_done_add_now', kwargs={'task_id': self.task.pk, 'next': 'todo'})
+        self.client.post(url, {'duration': 5})
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.last_done_at, self.task.taskdone_set.get().when)
+        self.assertLess(self.task.priority(), 1)
+
+@skipUnless(connection.vendor == 'sqlite', "query plans are only checked against SQLite")
+class QueryPlanTests(ImacsTestCase):
+    nb_tasks = 20
+
+    def setUp(self):
+        super().setUp()
+        self.task = Task.objects.filter(task_category__task_list=self.task_list).first()
+        # No ANALYZE: without statistics SQLite plans as if the tables were big,
+        # whereas on this tiny dataset scanning a table would be the best plan.
+
+    def assertNoFullScan(self, queryset, sorts=False):
+        """No table scan, and no temporary B-tree unless `sorts` (e.g. on the priority, which no index holds)"""
+        plan = queryset.explain()
+        full_scans = [line for line in plan.splitlines() if re.search(r'\bSCAN\b', line) and 'INDEX' not in line]
+        self.assertEqual(full_scans, [], plan)
+        if not sorts:
+            self.assertNotIn('USE TEMP B-TREE', plan)
+
+    def test_hot_queries_use_indexes(self):
+        week_ago = timezone.now() - timedelta(days=7)
+        self.assertNoFullScan(self.task.taskdone_set.order_by('-when')[:1])
+        # The DISTINCT sorts the tasks of the list, not their completions
+        self.assertNoFullScan(Task.objects.filter(task_category__task_list=self.task_list, taskdone__when__gte=week_ago).distinct(), sorts=True)
+        self.assertNoFullScan(TaskDone.objects.filter(task_list_id=self.task_list.pk).order_by('-when')[:30])
+        self.assertNoFullScan(Task.objects.filter(task_category__task_list__id=self.task_list.pk, tasked_user=self.user).by_priority(), sorts=True)
+        self.assertNoFullScan(Task.objects.filter(task_category__task_list__id=self.task_list.pk).by_priority(), sorts=True)
+        after = (timezone.now(), 10)
+        seek = Q(when__lt=after[0]) | Q(when=after[0], pk__lt=after[1])
+        self.assertNoFullScan(self.task.taskdone_set.filter(seek).order_by('-when', '-pk')[:50])
+        self.assertNoFullScan(TaskDone.objects.filter(seek, task_list_id=self.task_list.pk).order_by('-when', '-pk')[:30])
+
+class TaskListCacheTests(ImacsTestCase):
+    nb_tasks = 5
+
+    def get_todo(self):
+        return self.client.get(reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.task_list.pk}))
+
+    def test_cache_is_reused_until_the_list_changes(self):
+        with CaptureQueriesContext(connection) as cold:
+            self.get_todo()
+        with CaptureQueriesContext(connection) as warm:
+            self.get_todo()
+        self.assertLess(len(warm), len(cold))
+        self.assertEqual(cache_info(), {'hits': 2, 'misses': 2})
+
+        task = Task.objects.filter(task_category__task_list=self.task_list).first()
+        TaskDone.objects.create(task=task)
+        response = self.get_todo()
+        self.assertEqual(cache_info(), {'hits': 2, 'misses': 4})
+        self.assertLess([t for t in response.context['tasks'] if t.pk == task.pk][0].priority(), 0.01)
+
+    @override_settings(IMACS_CACHE_STATS_INTERVAL=3600)
+    def test_counts_are_written_per_interval(self):
+        self.get_todo()
+        self.get_todo()
+        self.assertIsNone(cache.get(HITS_KEY))
+        self.assertEqual(cache_info(), {'hits': 2, 'misses': 2})
+
+    def test_members_change_invalidates_the_stats(self):
+        self.get_todo()
+        bob = User.objects.create_user("bob", password="bob")
+        self.task_list.users.add(bob)
+        self.assertIn(bob, [user for user, hours in self.get_todo().context['stats'].hours_per_user])
+        bob.tasklist_set.clear()
+        self.assertNotIn(bob, [user for user, hours in self.get_todo().context['stats'].hours_per_user])
+
+    def test_deployments_share_the_cache(self):
+        self.assertFalse(is_shared_cache())
+        for module in ['imacs.settings.nix', 'imacs.settings.nix-unsafe']:
+            with self.subTest(module), override_settings(CACHES=import_module(module).CACHES):
+                self.assertTrue(is_shared_cache())
+
+class QueryBudgetTests(ImacsTestCase):
+    """The number of queries of a view must not depend on the size of the task list."""
+    sizes = [10, 100, 1000]
+    nb_tasks = None
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.task_lists = []
+        for size in cls.sizes:
+            call_command('seed_workload', tasks=size, categories=max(1, size//20), years=0.5, prefix=f'budget{size}', stdout=StringIO())
+            cls.task_lists.append(TaskList.objects.get(name=f'budget{size} list 0'))
+
+    def assertConstantNumQueries(self, view_name, get_kwargs):
+        nb_queries = []
+        for task_list in self.task_lists:
+            cache.clear()
+            user = task_list.users.order_by('pk').first()
+            self.client.force_login(user)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(view_name, kwargs=get_kwargs(task_list)))
+            self.assertEqual(response.status_code, 200)
+            nb_queries.append(len(queries))
+        self.assertEqual(len(set(nb_queries)), 1, f"{view_name} queries for {self.sizes} tasks: {nb_queries}")
+
+    def busiest_task(self, task_list):
+        # The task with the longest history, assigned to nobody to render the same form everywhere
+        return (Task.objects.filter(task_category__task_list=task_list, tasked_user=None)
+            .annotate(nb_done=Count('taskdone')).order_by('-nb_done').first())
+
+    def test_task_list_views(self):
+        for view_name in ['task_list_todo', 'task_list_my_tasks', 'task_list_summary', 'task_list_completions', 'task_list_modify']:
+            with self.subTest(view_name):
+                self.assertConstantNumQueries(f'imacs_app:{view_name}', lambda task_list: {'task_list_id': task_list.pk})
+
+    def test_task_modify(self):
+        self.assertConstantNumQueries('imacs_app:task_modify', lambda task_list: {'task_id': self.busiest_task(task_list).pk})
+
+class PermissionTests(ImacsTestCase):
+    nb_tasks = 1
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.user
+        self.bob = User.objects.create_user("bob", password="bob")
+        self.task = Task.objects.get(task_category__task_list=self.task_list)
+        self.task_done = TaskDone.objects.create(task=self.task)
+        self.urls = [
+            reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.task_list.pk}),
+            reverse('imacs_app:task_category_modify', kwargs={'task_category_id': self.task.task_category_id}),
+            reverse('imacs_app:task_modify', kwargs={'task_id': self.task.pk}),
+            reverse('imacs_app:task_done_delete', kwargs={'task_done_id': self.task_done.pk}),
+        ]
+
+    def test_members_only(self):
+        self.client.force_login(self.bob)
+        for url in self.urls:
+            self.assertEqual(self.client.get(url).status_code, 403, url)
+        self.client.force_login(self.alice)
+        for url in self.urls:
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+
+    def test_permission_check_loads_the_object(self):
+        self.client.force_login(self.alice)
+        url = reverse('imacs_app:task_task_me', kwargs={'task_id': self.task.pk})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(url)
+        task_selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT') and '"imacs_app_task"' in query['sql']]
+        self.assertEqual(len(task_selects), 1, task_selects)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.tasked_user, self.alice)
+
+    def test_task_list_modify_loads_the_list_once(self):
+        self.client.force_login(self.alice)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('imacs_app:task_list_modify', kwargs={'task_list_id': self.task_list.pk}))
+        self.assertEqual(response.status_code, 200)
+        list_selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT "imacs_app_tasklist"."id", "imacs_app_tasklist"."name"')]
+        self.assertEqual(len(list_selects), 1, list_selects)
+
+@override_settings(IMACS_FAST_AUTH=True, SESSION_ENGINE='django.contrib.sessions.backends.cached_db')
+class FastAuthTests(PermissionTests):
+    def setUp(self):
+        super().setUp()
+        # A cache shared by the workers, like in the deployments
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared_cache = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': directory.name,
+        }})
+        shared_cache.enable()
+        self.addCleanup(shared_cache.disable)
+
+    def test_refuses_a_cache_per_process(self):
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            with self.assertRaises(ImproperlyConfigured):
+                middleware.FastAuthenticationMiddleware(lambda request: HttpResponse())
+
+    def test_warm_request_without_queries(self):
+        self.client.login(username="alice", password="alice")
+        self.client.get(self.urls[0])
+        with self.assertNumQueries(0):
+            response = self.client.get(self.urls[0])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user'], self.alice)
+
+    def test_memberships_follow_the_signals(self):
+        self.client.force_login(self.bob)
+        self.assertEqual(self.client.get(self.urls[0]).status_code, 403)
+        self.task_list.users.add(self.bob)
+        for url in self.urls:
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+        self.bob.tasklist_set.remove(self.task_list)
+        self.assertEqual(self.client.get(self.urls[2]).status_code, 403)
+        self.task_list.users.add(self.bob)
+        self.assertEqual(self.client.get(self.urls[2]).status_code, 200)
+        self.task_list.users.clear()
+        self.assertEqual(self.client.get(self.urls[0]).status_code, 403)
+
+    def test_removed_member_loses_access_at_once(self):
+        self.task_list.users.add(self.bob)
+        self.client.force_login(self.bob)
+        for url in self.urls:
+            self.assertEqual(self.client.get(url).status_code, 200, url)
+        self.task_list.users.remove(self.bob)
+        for url in self.urls:
+            self.assertEqual(self.client.get(url).status_code, 403, url)
+
+    def test_password_change_logs_out(self):
+        self.client.login(username="alice", password="alice")
+        self.assertEqual(self.client.get(self.urls[0]).status_code, 200)
+        self.alice.set_password("alice2")
+        self.alice.save()
+        self.assertEqual(self.client.get(self.urls[0]).status_code, 302)
+
+    def test_inactive_user(self):
+        self.client.force_login(self.alice)
+        self.assertEqual(self.client.get(self.urls[0]).status_code, 200)
+        self.alice.is_active = False
+        self.alice.save()
+        self.assertEqual(self.client.get(self.urls[0]).status_code, 302)
+
+class PaginationTests(ImacsTestCase):
+    nb_done_per_task = 12
+
+    def setUp(self):
+        super().setUp()
+        self.task = Task.objects.filter(task_category__task_list=self.task_list).last()
+        # Ties on `when` must be broken by the id
+        TaskDone.objects.bulk_create([TaskDone(task=self.task, when=self.task.last_done_at) for _ in range(5)])
+
+    def fetch_all(self, url, name, page_size, max_queries):
+        # Every page is fetched as a fragment to compare the queries of the first and the next
+        # pages, but the last one which may show the rollups: they must not grow with the depth
+        seen = []
+        nb_queries = []
+        cursor = None
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, {'after': cursor or '', 'fragment': 'rows'})
+            page = response.context[name]
+            self.assertLessEqual(len(page), page_size)
+            seen += page
+            cursor = response.get('X-Next-Cursor')
+            if cursor is None:
+                self.assertEqual(response.context['next_cursor'], None)
+                break
+            nb_queries.append(len(queries))
+        self.assertGreater(len(nb_queries), 1)
+        self.assertEqual(set(nb_queries), {nb_queries[0]})
+        self.assertLessEqual(nb_queries[0], max_queries)
+        return seen
+
+    def test_completions(self):
+        url = reverse('imacs_app:task_list_completions', kwargs={'task_list_id': self.task_list.pk})
+        # The session, the user, the task list and the page
+        task_dones = self.fetch_all(url, 'task_dones', 30, 4)
+        expected = list(TaskDone.objects.filter(task__task_category__task_list=self.task_list).order_by('-when', '-pk'))
+        self.assertEqual(task_dones, expected)
+
+    def test_task_modify(self):
+        url = reverse('imacs_app:task_modify', kwargs={'task_id': self.task.pk})
+        TaskDone.objects.bulk_create([TaskDone(task=self.task, when=timezone.now() - timedelta(days=i)) for i in range(120)])
+        task_dones = self.fetch_all(url, 'task_dones', 50, 4)
+        self.assertEqual(task_dones, list(self.task.taskdone_set.order_by('-when', '-pk')))
+
+    def test_invalid_cursor(self):
+        url = reverse('imacs_app:task_list_completions', kwargs={'task_list_id': self.task_list.pk})
+        self.assertEqual(self.client.get(url, {'after': 'nope'}).status_code, 400)
+
+class RollupTests(ImacsTestCase):
+    nb_tasks = 3
+    nb_done_per_task = 0
+
+    def setUp(self):
+        super().setUp()
+        self.task = Task.objects.filter(task_category__task_list=self.task_list).first()
+        now = timezone.now()
+        self.old = [TaskDone.objects.create(task=self.task, when=now - timedelta(days=100 + i), duration=i) for i in range(20)]
+        self.recent = [TaskDone.objects.create(task=self.task, when=now - timedelta(days=i)) for i in range(3)]
+
+    def test_compaction(self):
+        call_command('compact_task_dones', retention_days=30, stdout=StringIO())
+        self.assertEqual(set(self.task.taskdone_set.all()), set(self.recent))
+        rollups = self.task.taskdonerollup_set.all()
+        self.assertEqual(sum(rollup.count for rollup in rollups), 20)
+        self.assertEqual(sum(rollup.duration for rollup in rollups), sum(range(20)))
+        self.assertEqual(max(rollup.last_done for rollup in rollups), self.old[0].when)
+
+        # Running it again changes nothing, new old rows are added to the existing rollups
+        call_command('compact_task_dones', retention_days=30, stdout=StringIO())
+        self.assertEqual(sum(rollup.count for rollup in self.task.taskdonerollup_set.all()), 20)
+        TaskDone.objects.create(task=self.task, when=self.old[0].when)
+        call_command('compact_task_dones', retention_days=30, stdout=StringIO())
+        self.assertEqual(sum(rollup.count for rollup in self.task.taskdonerollup_set.all()), 21)
+        self.assertEqual(self.task.taskdonerollup_set.count(), rollups.count())
+
+    def test_compaction_queries_do_not_depend_on_the_history(self):
+        tasks = list(Task.objects.filter(task_category__task_list=self.task_list))
+        now = timezone.now()
+        TaskDone.objects.bulk_create([TaskDone(task=tasks[i%3], when=now - timedelta(days=40 + i%300, minutes=i)) for i in range(500)])
+        # The tasks, then per batch: the summaries, the rollups, their insert, the DELETE and
+        # the task lists, within a savepoint
+        with self.assertNumQueries(8):
+            self.assertEqual(rollup.compact(now - timedelta(days=30)), 520)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.last_done_at, self.recent[0].when)
+
+    def test_last_done_falls_back_to_rollups(self):
+        call_command('compact_task_dones', retention_days=30, stdout=StringIO())
+        for task_done in self.recent:
+            task_done.delete()
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.last_done_at, self.old[0].when)
+
+    def test_history_shows_rollups(self):
+        call_command('compact_task_dones', retention_days=30, period='month', stdout=StringIO())
+        response = self.client.get(reverse('imacs_app:task_modify', kwargs={'task_id': self.task.pk}))
+        self.assertEqual(list(response.context['task_dones']), sorted(self.recent, key=lambda x: x.when, reverse=True))
+        self.assertContains(response, "Month du")
+
+    def test_completions_show_rollups(self):
+        call_command('compact_task_dones', retention_days=30, period='month', stdout=StringIO())
+        response = self.client.get(reverse('imacs_app:task_list_completions', kwargs={'task_list_id': self.task_list.pk}))
+        self.assertEqual(list(response.context['task_dones']), sorted(self.recent, key=lambda x: x.when, reverse=True))
+        self.assertEqual(response.context['rollups'], list(self.task.taskdonerollup_set.order_by('-last_done', '-pk')))
+        self.assertContains(response, "Month du")
+
+    def test_completions_paginate_rollups(self):
+        now = timezone.now()
+        TaskDoneRollup.objects.bulk_create([
+            TaskDoneRollup(task=self.task, period=TaskDoneRollup.WEEK, period_start=(now - timedelta(weeks=20 + i)).date(), count=1, last_done=now - timedelta(weeks=20 + i))
+            for i in range(70)
+        ])
+        url = reverse('imacs_app:task_list_completions', kwargs={'task_list_id': self.task_list.pk})
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['task_dones']) + len(response.context['rollups']), 23 + 30)
+        rollups = response.context['rollups']
+        while response.get('X-Next-Cursor'):
+            response = self.client.get(url, {'after': response['X-Next-Cursor'], 'fragment': 'rows'})
+            self.assertEqual(response.context['task_dones'], [])
+            self.assertLessEqual(len(response.context['rollups']), 30)
+            rollups += response.context['rollups']
+        self.assertEqual(rollups, list(TaskDoneRollup.objects.order_by('-last_done', '-pk')))
+
+class TaskListApiTests(ImacsTestCase):
+    nb_tasks = 20
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('imacs_app:task_list_api_todo', kwargs={'task_list_id': self.task_list.pk})
+
+    def test_content(self):
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['name'], self.task_list.name)
+        self.assertEqual([goal['user'] for goal in data['goals']], ["alice"])
+        self.assertEqual(len(data['tasks']), 20)
+        self.assertIsNone(data['tasks'][0]['priority'])
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        etag = response['ETag']
+        self.assertFalse(etag.startswith('W/'))
+        # Session, user and permission check only
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=60')
+        # The priorities drift with time, but minute pollers still get a 304
+        with patch('time.time', return_value=timezone.now().timestamp() + 3600):
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        TaskDone.objects.create(task=Task.objects.filter(task_category__task_list=self.task_list).first())
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_gzip(self):
+        identity_etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        # The same validator, but weak: the bodies differ
+        self.assertEqual(response['ETag'], f'W/{identity_etag}')
+        for etag in [identity_etag, response['ETag']]:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response.status_code, 304)
+            self.assertIn('Accept-Encoding', response['Vary'])
+
+class BulkTests(ImacsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tasks = list(Task.objects.filter(task_category__task_list=self.task_list).order_by('pk'))
+
+    def test_bulk_done(self):
+        url = reverse('imacs_app:task_list_bulk_done', kwargs={'task_list_id': self.task_list.pk})
+        when = timezone.now() + timedelta(hours=1)
+        pks = [task.pk for task in self.tasks[:4]]
+        response = self.client.post(url, {'tasks': pks, f'duration_{pks[0]}': 12, f'when_{pks[1]}': when.isoformat()})
+        self.assertRedirects(response, reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.task_list.pk}))
+        self.assertEqual(TaskDone.objects.filter(task=self.tasks[0]).latest('when').duration, 12)
+        for task in Task.objects.filter(pk__in=pks):
+            self.assertIsNone(task.tasked_user)
+            self.assertEqual(task.last_done_at, task.taskdone_set.aggregate(last_done=Max('when'))['last_done'])
+        self.assertEqual(Task.objects.get(pk=pks[1]).last_done_at, when)
+        self.assertEqual(Task.objects.get(pk=self.tasks[4].pk).tasked_user, self.user)
+
+    def test_bulk_done_rejects_other_lists(self):
+        other_task = Task.objects.filter(task_category__task_list=create_task_list(self.user, 1)).get()
+        url = reverse('imacs_app:task_list_bulk_done', kwargs={'task_list_id': self.task_list.pk})
+        nb_task_dones = TaskDone.objects.count()
+        response = self.client.post(url, {'tasks': [self.tasks[0].pk, other_task.pk]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(TaskDone.objects.count(), nb_task_dones)
+
+    def test_bulk_assign(self):
+        url = reverse('imacs_app:task_list_bulk_assign', kwargs={'task_list_id': self.task_list.pk})
+        pks = [task.pk for task in self.tasks]
+        self.client.post(url, {'tasks': pks, 'tasked_user': self.user.pk})
+        self.assertEqual(Task.objects.filter(pk__in=pks, tasked_user=self.user).count(), len(pks))
+        self.client.post(url, {'tasks': pks, 'tasked_user': ''})
+        self.assertEqual(Task.objects.filter(pk__in=pks, tasked_user=None).count(), len(pks))
+
+class AssignmentTests(ImacsTestCase):
+    nb_tasks = 40
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.user
+        self.bob = User.objects.create_user("bob", password="bob")
+        self.carol = User.objects.create_user("carol", password="carol")
+        self.task_list.users.add(self.bob, self.carol)
+
+    def loads(self):
+        return {user: sum(Task.objects.filter(task_category__task_list=self.task_list, tasked_user=user).values_list('duration', flat=True))
+            for user in [self.alice, self.bob, self.carol]}
+
+    def test_assign(self):
+        due = set(assignment.due_tasks(self.task_list).values_list('pk', flat=True))
+        not_due = Task.objects.filter(task_category__task_list=self.task_list, tasked_user=None).exclude(pk__in=due)
+        self.assertTrue(due and not_due.exists())
+        not_due = set(not_due.values_list('pk', flat=True))
+        tasked = dict(Task.objects.filter(task_category__task_list=self.task_list).exclude(tasked_user=None).values_list('pk', 'tasked_user'))
+
+        with CaptureQueriesContext(connection) as queries:
+            assignments = assignment.assign(self.task_list)
+        self.assertEqual(set(assignments), due)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(dict(Task.objects.filter(pk__in=tasked).values_list('pk', 'tasked_user')), tasked)
+        self.assertFalse(Task.objects.filter(pk__in=not_due).exclude(tasked_user=None).exists())
+        for task_id, user_id in assignments.items():
+            self.assertEqual(Task.objects.get(pk=task_id).tasked_user_id, user_id)
+        # alice already had the even tasks, the due ones go to bob and carol
+        loads = self.loads()
+        self.assertLessEqual(abs(loads[self.bob] - loads[self.carol]), max(Task.objects.filter(pk__in=due).values_list('duration', flat=True)))
+        self.assertEqual(assignment.assign(self.task_list), {})
+
+    def test_plan_balances(self):
+        class FakeTask:
+            def __init__(self, pk, duration, annotated_priority):
+                self.pk, self.duration, self.annotated_priority = pk, duration, annotated_priority
+        tasks = [FakeTask(i, 5 + (i*37)%60, (i%9)/3 if i%11 else None) for i in range(3000)]
+        loads = {user_id: user_id*10 for user_id in range(40)}
+        assignments = assignment.plan(tasks, loads)
+        self.assertEqual(len(assignments), len(tasks))
+        for task in tasks:
+            loads[assignments[task.pk]] += task.duration
+        # LPT: the spread is at most the longest task
+        self.assertLessEqual(max(loads.values()) - min(loads.values()), 64)
+        self.assertEqual(assignment.plan(tasks, {}), {})
+
+    def test_button_and_command(self):
+        self.client.force_login(self.bob)
+        url = reverse('imacs_app:task_list_auto_assign', kwargs={'task_list_id': self.task_list.pk})
+        todo_url = reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.task_list.pk})
+        self.assertContains(self.client.get(todo_url), url)
+        self.assertRedirects(self.client.post(url), todo_url)
+        self.assertFalse(assignment.due_tasks(self.task_list).exists())
+        self.assertContains(self.client.get(todo_url), "bob")
+
+        Task.objects.filter(task_category__task_list=self.task_list).update(tasked_user=None)
+        out = StringIO()
+        call_command('assign_tasks', self.task_list.pk, stdout=out)
+        self.assertIn("assigned", out.getvalue())
+        self.assertFalse(assignment.due_tasks(self.task_list).exists())
+
+class ForecastTests(ImacsTestCase):
+    nb_tasks = 30
+
+    def naive_forecast(self, weeks, now):
+        """Step through every day, like calling Task.priority() day by day"""
+        today = timezone.localdate(now)
+        start = timezone.make_aware(datetime.combine(today, time()))
+        minutes = {}
+        for task in Task.objects.filter(task_category__task_list=self.task_list):
+            due = task.last_done_at + timedelta(days=task.period) if task.last_done_at else start
+            for i in range(7*weeks):
+                day_start = start + timedelta(days=i)
+                if due < day_start + timedelta(days=1):
+                    key = (i, task.tasked_user_id)
+                    minutes[key] = minutes.get(key, 0) + task.duration
+                    due = max(due, day_start) + timedelta(days=task.period)
+        return minutes
+
+    def test_views_import_without_numpy(self):
+        code = "import sys; sys.modules['numpy'] = None; import django; django.setup(); import imacs.urls"
+        process = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True)
+        self.assertEqual(process.returncode, 0, process.stderr)
+
+    def test_matches_naive_forecast(self):
+        now = timezone.now()
+        result = forecast.Forecast(self.task_list, 3, now)
+        expected = self.naive_forecast(3, now)
+        self.assertEqual(len(result.days), 21)
+        for i in range(21):
+            self.assertEqual(result.per_user[0][1][i], expected.get((i, self.user.pk), 0))
+            self.assertEqual(result.per_user[-1][1][i], expected.get((i, None), 0))
+            self.assertEqual(result.total[i], expected.get((i, self.user.pk), 0) + expected.get((i, None), 0))
+
+    def test_views(self):
+        url = reverse('imacs_app:task_list_forecast', kwargs={'task_list_id': self.task_list.pk})
+        with self.assertNumQueries(5): # session, user, task list, tasks, members
+            response = self.client.get(url, {'weeks': 2})
+        self.assertEqual(len(list(response.context['forecast'].rows())), 14)
+        self.assertContains(response, "alice")
+        self.assertEqual(self.client.get(url, {'weeks': 0}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'weeks': 'x'}).status_code, 400)
+
+        response = self.client.get(reverse('imacs_app:task_list_api_forecast', kwargs={'task_list_id': self.task_list.pk}))
+        data = response.json()
+        self.assertEqual(len(data['days']), 28)
+        self.assertEqual([row['user'] for row in data['per_user']], ["alice", None])
+        self.assertAlmostEqual(sum(data['total']), sum(sum(row['minutes']) for row in data['per_user']))
+
+class TodoFragmentTests(ImacsTestCase):
+    nb_tasks = None
+
+    def post_fragment(self, task_list, name, index, data={}):
+        task = Task.objects.filter(task_category__task_list=task_list).order_by('pk')[index]
+        kwargs = {'task_id': task.pk, 'next': 'todo'} if name == 'task_done_add_now' else {'task_id': task.pk}
+        url = reverse(f'imacs_app:{name}', kwargs=kwargs)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'{url}?fragment=row', data)
+        return task, response, len(queries)
+
+    def test_done(self):
+        task_list = create_task_list(self.user, 10)
+        task, response, _ = self.post_fragment(task_list, 'task_done_add_now', 0)
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertEqual(content.count('data-task-id='), 1)
+        self.assertIn(f'data-task-id="{task.pk}"', content)
+        self.assertIn('id="todo-stats"', content)
+        self.assertIn('Task me', content) # untasked
+        task.refresh_from_db()
+        self.assertIsNone(task.tasked_user)
+        self.assertEqual(task.taskdone_set.count(), 1) # the first task had no completion
+
+        task, response, _ = self.post_fragment(task_list, 'task_done_add_now', 1, {'duration': -1})
+        self.assertEqual(response.status_code, 400)
+
+    def test_task_me(self):
+        task_list = create_task_list(self.user, 10)
+        task, response, _ = self.post_fragment(task_list, 'task_task_me', 1)
+        self.assertContains(response, f'data-task-id="{task.pk}"')
+        self.assertContains(response, "alice")
+        self.assertEqual(Task.objects.get(pk=task.pk).tasked_user, self.user)
+
+        # Without the fragment parameter, the action still redirects to the todo page
+        task = Task.objects.filter(task_category__task_list=task_list).order_by('pk')[3]
+        response = self.client.post(reverse('imacs_app:task_task_me', kwargs={'task_id': task.pk}))
+        self.assertRedirects(response, reverse('imacs_app:task_list_todo', kwargs={'task_list_id': task_list.pk}))
+
+    def test_queries_do_not_depend_on_the_list_size(self):
+        nb_queries = set()
+        for nb_tasks in [5, 60]:
+            task_list = create_task_list(self.user, nb_tasks)
+            nb_queries.add(self.post_fragment(task_list, 'task_done_add_now', 1)[2])
+        self.assertEqual(len(nb_queries), 1)
+
+    def test_todo_page_uses_the_row_fragment(self):
+        task_list = create_task_list(self.user, 7)
+        response = self.client.get(reverse('imacs_app:task_list_todo', kwargs={'task_list_id': task_list.pk}))
+        self.assertTemplateUsed(response, 'imacs_app/task_list_todo_row.html', count=7)
+        self.assertTemplateUsed(response, 'imacs_app/task_list_todo_stats.html', count=1)
+
+class TemplateRenderingTests(ImacsTestCase):
+    nb_tasks = None
+
+    def test_reverse_id_matches_reverse(self):
+        for name, args in [('task_modify', []), ('task_done_add_now', ['todo']), ('task_done_add_now', ['my tasks'])]:
+            for object_id in [1, 42, 9876543210123]:
+                self.assertEqual(reversing.reverse_id(f'imacs_app:{name}', object_id, *args), reverse(f'imacs_app:{name}', args=[object_id, *args]))
+        set_script_prefix('/imacs/')
+        try:
+            self.assertEqual(reversing.reverse_id('imacs_app:task_modify', 3), '/imacs/task/3/modify')
+        finally:
+            set_script_prefix('/')
+        self.assertEqual(reversing.reverse_id('imacs_app:task_modify', 3), '/task/3/modify')
+
+    def test_todo_rows_link_to_their_task(self):
+        task_list = create_task_list(self.user, 5)
+        response = self.client.get(reverse('imacs_app:task_list_todo', kwargs={'task_list_id': task_list.pk}))
+        for task in Task.objects.filter(task_category__task_list=task_list):
+            self.assertContains(response, f'href="{reverse("imacs_app:task_modify", args=[task.pk])}"')
+            self.assertContains(response, f'action="{reverse("imacs_app:task_done_add_now", args=[task.pk, "todo"])}"')
+            self.assertContains(response, f'href="{reverse("imacs_app:task_modify_tasked_user", args=[task.pk])}"')
+
+    def test_header_follows_the_login(self):
+        task_list = create_task_list(self.user, 1)
+        url = reverse('imacs_app:task_list_todo', kwargs={'task_list_id': task_list.pk})
+        self.assertContains(self.client.get(url), "Logout")
+        self.client.logout()
+        response = self.client.get(reverse('imacs_app:login'))
+        self.assertContains(response, "Login")
+        self.assertNotContains(response, "Logout")
+
+    def test_tabs_are_cached_per_list_and_tab(self):
+        for task_list in [create_task_list(self.user, 1), create_task_list(self.user, 1)]:
+            for tab in ['task_list_todo', 'task_list_summary']:
+                response = self.client.get(reverse(f'imacs_app:{tab}', kwargs={'task_list_id': task_list.pk}))
+                self.assertContains(response, f'href="{reverse("imacs_app:task_list_forecast", args=[task_list.pk])}"')
+                self.assertContains(response, f'class="is-active"><a href="{reverse(f"imacs_app:{tab}", args=[task_list.pk])}"')
+
+    def test_benchmark_render(self):
+        task_list = create_task_list(self.user, 3)
+        out = StringIO()
+        call_command('benchmark_render', task_list=task_list.pk, tasks=2, repeat=2, stdout=out)
+        self.assertIn("2 rows", out.getvalue())
+        self.assertIn("uncached", out.getvalue())
+
+class StaticFilesStorageTests(SimpleTestCase):
+    def test_purge_css(self):
+        css = ('/*! license */.a,.b{color:red}.b .c{margin:0}.a:not(.d){content:"}"}'
+            '@media screen and (min-width:769px){.a{padding:0}.b{padding:0}}@keyframes spin{from{opacity:0}to{opacity:1}}'
+            'html{font-size:16px}.a>.b::before{content:"{"}')
+        self.assertEqual(storage.purge_css(css, {'a'}),
+            '/*! license */.a{color:red}.a:not(.d){content:"}"}@media screen and (min-width:769px){.a{padding:0}}'
+            '@keyframes spin{from{opacity:0}to{opacity:1}}html{font-size:16px}')
+
+    def test_collectstatic(self):
+        with tempfile.TemporaryDirectory() as static_root:
+            with override_settings(STATIC_ROOT=static_root, STATICFILES_STORAGE='imacs_app.storage.CompressedManifestStaticFilesStorage'):
+                call_command('collectstatic', interactive=False, verbosity=0)
+                hashed_name = staticfiles_storage.stored_name('imacs_app/bulma-0.9.3.min.css')
+            self.assertRegex(hashed_name, r'^imacs_app/bulma-0\.9\.3\.min\.[0-9a-f]{12}\.css$')
+            path = Path(static_root, hashed_name)
+            css = path.read_bytes()
+            source = Path(finders.find('imacs_app/bulma-0.9.3.min.css')).read_bytes()
+            self.assertLess(len(css), len(source)/2)
+            for class_name in ['navbar-menu', 'is-active', 'tabs', 'is-danger', 'button']:
+                self.assertIn(f'.{class_name}'.encode(), css)
+            self.assertNotIn(b'.pagination-link', css)
+            self.assertEqual(gzip.decompress(Path(f'{path}.gz').read_bytes()), css)
+            if storage.brotli is not None:
+                self.assertEqual(storage.brotli.decompress(Path(f'{path}.br').read_bytes()), css)
+
+@override_settings(IMACS_READ_REPLICAS=['replica1'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def run_request(self, request, write=False):
+        """The database of the reads of `request` before and after its view writes (if `write`), and its response"""
+        reads = []
+        def view(request):
+            reads.append(self.router.db_for_read(Task))
+            if write:
+                self.assertEqual(self.router.db_for_write(Task), 'default')
+                reads.append(self.router.db_for_read(Task))
+            return HttpResponse()
+        response = middleware.ReplicaRoutingMiddleware(view)(request)
+        return reads, response
+
+    def test_outside_requests(self):
+        self.assertEqual(self.router.db_for_read(Task), 'default')
+        self.assertEqual(self.router.db_for_write(Task), 'default')
+        self.assertFalse(self.router.allow_migrate('replica1', 'imacs_app'))
+        self.assertIsNone(self.router.allow_migrate('default', 'imacs_app'))
+
+    def test_reads_follow_writes(self):
+        reads, response = self.run_request(self.factory.get('/'))
+        self.assertEqual(reads, ['replica1'])
+        self.assertNotIn('imacs_primary', response.cookies)
+
+        reads, response = self.run_request(self.factory.get('/'), write=True)
+        self.assertEqual(reads, ['replica1', 'default'])
+        self.assertEqual(response.cookies['imacs_primary']['max-age'], 10)
+
+        # The next requests of the browser
+        request = self.factory.get('/')
+        request.COOKIES['imacs_primary'] = '1'
+        self.assertEqual(self.run_request(request)[0], ['default'])
+
+    def test_unsafe_methods_use_the_primary(self):
+        reads, response = self.run_request(self.factory.post('/'), write=True)
+        self.assertEqual(reads, ['default', 'default'])
+        self.assertIn('imacs_primary', response.cookies)
+
+    @override_settings(IMACS_READ_REPLICAS=[])
+    def test_no_replica(self):
+        self.assertEqual(self.run_request(self.factory.get('/'))[0], ['default'])
+
+    def test_async(self):
+        async def view(request):
+            return HttpResponse(await sync_to_async(self.router.db_for_read, thread_sensitive=False)(Task))
+        response = async_to_sync(middleware.ReplicaRoutingMiddleware(view))(AsyncRequestFactory().get('/'))
+        self.assertEqual(response.content, b'replica1')
+
+@skipUnless(settings.IMACS_READ_REPLICAS, "needs replicas, run with DJANGO_SETTINGS_MODULE=imacs.settings.replicas (see its docstring)")
+class ReplicaRoutingIntegrationTests(ImacsTransactionTestCase):
+    databases = '__all__'
+    nb_tasks = 5
+
+    def setUp(self):
+        super().setUp()
+        call_command('sync_sqlite_replicas', stdout=StringIO())
+
+    def get_todo(self):
+        replica = connections[settings.IMACS_READ_REPLICAS[0]]
+        with CaptureQueriesContext(connection) as primary_queries, CaptureQueriesContext(replica) as replica_queries:
+            response = self.client.get(reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.task_list.pk}))
+        self.assertEqual(response.status_code, 200)
+        return response, len(primary_queries), len(replica_queries)
+
+    def test_read_your_writes(self):
+        response, primary_queries, replica_queries = self.get_todo()
+        self.assertEqual(primary_queries, 0)
+        self.assertGreater(replica_queries, 0)
+
+        task = Task.objects.filter(task_category__task_list=self.task_list, last_done_at=None).first()
+        response = self.client.post(reverse('imacs_app:task_done_add_now', kwargs={'task_id': task.pk, 'next': 'todo'}), {'duration': 5})
+        self.assertIn(settings.IMACS_REPLICA_PIN_COOKIE, response.cookies)
+
+        # The replica has not caught up, the page is read from the primary
+        response, primary_queries, replica_queries = self.get_todo()
+        self.assertEqual(replica_queries, 0)
+        self.assertIsNotNone(next(t for t in response.context['tasks'] if t.pk == task.pk).last_done_at)
+
+        # Once the pin expired, the reads go to the (stale) replica again
+        del self.client.cookies[settings.IMACS_REPLICA_PIN_COOKIE]
+        cache.clear()
+        response, primary_queries, replica_queries = self.get_todo()
+        self.assertEqual(primary_queries, 0)
+        self.assertIsNone(next(t for t in response.context['tasks'] if t.pk == task.pk).last_done_at)
+
+class SQLiteProductionBackendTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name)/'db.sqlite3'
+
+    def get_wrapper(self, **options):
+        settings_dict = {**connection.settings_dict, 'ENGINE': 'imacs_app.backends.sqlite3', 'NAME': self.path,
+            'OPTIONS': {**settings.IMACS_SQLITE_PRODUCTION_OPTIONS, **options}}
+        wrapper = sqlite_backend.DatabaseWrapper(settings_dict, 'sqlite_production')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def pragma(self, wrapper, name):
+        with wrapper.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_init_command(self):
+        wrapper = self.get_wrapper()
+        self.assertEqual(self.pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(wrapper, 'synchronous'), 1) # NORMAL
+        self.assertEqual(self.pragma(wrapper, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(wrapper, 'cache_size'), -16000)
+
+    def test_immediate_transactions(self):
+        wrapper = self.get_wrapper()
+        wrapper.ensure_connection()
+        other = sqlite3.connect(self.path, timeout=0)
+        self.addCleanup(other.close)
+        with CaptureQueriesContext(wrapper) as queries:
+            wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True) # like atomic()
+        self.assertEqual([query['sql'] for query in queries], ['BEGIN IMMEDIATE'])
+        # The write lock is taken before any write
+        with self.assertRaisesRegex(sqlite3.OperationalError, 'locked'):
+            other.execute('BEGIN IMMEDIATE')
+        wrapper.set_autocommit(True)
+        other.execute('BEGIN IMMEDIATE')
+        other.rollback()
+
+    def test_invalid_transaction_mode(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.get_wrapper(transaction_mode='LATER').ensure_connection()
+
+    def test_optimize_on_close(self):
+        sqlite_backend.last_optimize.pop(self.path, None)
+        wrapper = self.get_wrapper(optimize_interval=3600)
+        wrapper.ensure_connection()
+        wrapper.close()
+        optimized_at = sqlite_backend.last_optimize[self.path]
+        # Not again within the interval
+        wrapper.ensure_connection()
+        wrapper.close()
+        self.assertEqual(sqlite_backend.last_optimize[self.path], optimized_at)
+
+    def test_profile_keeps_the_connections(self):
+        # Not a connection, and its pragmas, per request
+        with patch.dict('os.environ', {'IMACS_BASE_SETTINGS': 'imacs.settings.dev', 'SQLITE_PATH': str(self.path)}):
+            profile = import_module('imacs.settings.sqlite')
+        self.assertGreater(profile.DATABASES['default']['CONN_MAX_AGE'], 0)
+
+class StressSQLiteTests(ImacsTransactionTestCase):
+    nb_tasks = 5
+    nb_done_per_task = 0
+
+    def test_stress_sqlite(self):
+        out = StringIO()
+        call_command('stress_sqlite', task_list=self.task_list.pk, writers=2, readers=1, duration=0.2, stdout=out)
+        rows = {line.split()[0]: line.split() for line in out.getvalue().splitlines()[2:]}
+        self.assertEqual(set(rows), {'dev', 'pragmas', 'production'})
+        self.assertGreater(float(rows['production'][1]), 0) # writes/s
+        # The copies are written, not the database
+        self.assertFalse(TaskDone.objects.exists())
+
+class TransferTests(ImacsTestCase):
+    def setUp(self):
+        super().setUp()
+        Task.objects.filter(task_category__task_list=self.task_list).update(description="Deux lignes,\n\"citées\"")
+        call_command('compact_task_dones', retention_days=7, stdout=StringIO())
+
+    def snapshot(self, task_list):
+        return sorted(
+            (task.task_category.name, task.name, task.description, task.duration, task.period, task.tasked_user_id, task.last_done_at,
+                tuple(task.taskdone_set.order_by('when').values_list('when', 'duration')),
+                tuple(task.taskdonerollup_set.order_by('period_start').values_list('period', 'period_start', 'count', 'duration', 'last_done')))
+            for task in Task.objects.filter(task_category__task_list=task_list)
+        )
+
+    def test_export_import_round_trip(self):
+        for format in ['ndjson', 'csv']:
+            with self.subTest(format):
+                response = self.client.get(reverse('imacs_app:task_list_export', kwargs={'task_list_id': self.task_list.pk}), {'format': format})
+                self.assertTrue(response.streaming)
+                export = SimpleUploadedFile(f'export.{format}', b''.join(response.streaming_content))
+                response = self.client.post(reverse('imacs_app:task_list_import'), {'file': export, 'format': format, 'name': format})
+                task_list = TaskList.objects.get(name=format)
+                self.assertRedirects(response, reverse('imacs_app:task_list_summary', kwargs={'task_list_id': task_list.pk}))
+                self.assertEqual(list(task_list.users.all()), [self.user])
+                self.assertEqual(self.snapshot(task_list), self.snapshot(self.task_list))
+
+    def test_export_under_asgi(self):
+        # Like the test client, keep the connection of the test transaction
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        url = reverse('imacs_app:task_list_export', kwargs={'task_list_id': self.task_list.pk})
+        expected = b''.join(self.client.get(url, {'format': 'csv'}).streaming_content)
+        cookie = '; '.join(f'{key}={morsel.value}' for key, morsel in self.client.cookies.items()).encode()
+        scope = {'type': 'http', 'method': 'GET', 'path': url, 'query_string': b'format=csv', 'headers': [(b'host', b'testserver'), (b'cookie', cookie)]}
+        async def run():
+            communicator = ApplicationCommunicator(asgi.get_asgi_application(), scope)
+            await communicator.send_input({'type': 'http.request'})
+            self.assertEqual((await communicator.receive_output(5))['status'], 200)
+            body = b''
+            while True:
+                message = await communicator.receive_output(5)
+                body += message.get('body', b'')
+                if not message.get('more_body'):
+                    return body
+        self.assertEqual(async_to_sync(run)(), expected)
+
+    def test_invalid_import(self):
+        export = SimpleUploadedFile('export.ndjson', b'{"type": "task", "id": 1}\n')
+        response = self.client.post(reverse('imacs_app:task_list_import'), {'file': export, 'format': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(TaskList.objects.exclude(pk=self.task_list.pk).exists())
+
+    def test_malformed_records(self):
+        task_list = '{"type": "task_list", "id": 1, "name": "malformed", "users": []}'
+        category = '{"type": "category", "id": 1, "parent": 1, "name": "Cuisine"}'
+        task = '{"type": "task", "id": 1, "parent": 1, "name": "Vaisselle", "description": "", "duration": 10, "period": 1, "user": null}'
+        records = {
+            'missing when': '{"type": "done", "id": 1, "parent": 1, "duration": null}',
+            'null when': '{"type": "done", "id": 1, "parent": 1, "when": null, "duration": null}',
+            'invalid when': '{"type": "done", "id": 1, "parent": 1, "when": "hier", "duration": null}',
+            'wrong type': '{"type": "done", "id": 1, "parent": 1, "when": "2021-08-01T12:00:00+00:00", "duration": [10]}',
+            'wrong task type': task.replace('"period": 1', '"period": "souvent"'),
+            'duplicate rollup': '\n'.join(['{"type": "rollup", "id": 1, "parent": 1, "name": "week", "start": "2021-08-02", "count": 1, "duration": 0, "when": "2021-08-02T12:00:00+00:00"}'] * 2),
+            'not an object': '[1, 2]',
+        }
+        for reason, record in records.items():
+            with self.subTest(reason):
+                export = SimpleUploadedFile('export.ndjson', '\n'.join([task_list, category, task, record]).encode())
+                response = self.client.post(reverse('imacs_app:task_list_import'), {'file': export, 'format': 'ndjson'})
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, "Invalid export")
+                self.assertFalse(TaskList.objects.exclude(pk=self.task_list.pk).exists())
+
+    def test_malformed_files(self):
+        header = ','.join(transfer.CSV_COLUMNS)
+        files = {
+            'unterminated quote': ('csv', f'{header}\ntask_list,1,,"malformed\n'.encode()),
+            'text after a quote': ('csv', f'{header}\ntask_list,1,,"malformed"x\n'.encode()),
+            'not a number': ('csv', f'{header}\ntask_list,un,,malformed\n'.encode()),
+            'not utf-8': ('csv', f'{header}\ntask_list,1,,Ménage\n'.encode('latin-1')),
+            'not json': ('ndjson', b'{"type": "task_list",'),
+        }
+        for reason, (format, content) in files.items():
+            with self.subTest(reason):
+                export = SimpleUploadedFile(f'export.{format}', content)
+                response = self.client.post(reverse('imacs_app:task_list_import'), {'file': export, 'format': format})
+                self.assertEqual(response.status_code, 200)
+                self.assertContains(response, "Invalid export")
+                self.assertFalse(TaskList.objects.exclude(pk=self.task_list.pk).exists())
+
+class RequestTimingMiddlewareTests(ImacsTestCase):
+    nb_tasks = 5
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.task_list.pk})
+
+    def test_server_timing_header(self):
+        response = self.client.get(self.url)
+        metrics = [metric.split(';')[0] for metric in response['Server-Timing'].split(', ')]
+        self.assertEqual(metrics, ['db', 'view', 'render', 'total'])
+
+    def test_server_timing_header_async(self):
+        # Through the ASGI handler the queries run in other threads
+        client = AsyncClient()
+        client.cookies = self.client.cookies
+        async def get():
+            return await client.get(self.url)
+        response = async_to_sync(get)()
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'db;dur=[0-9.]+;desc="[1-9][0-9]* queries"')
+
+    @override_settings(IMACS_SLOW_REQUEST_QUERIES=0)
+    def test_slow_request_log(self):
+        with self.assertLogs('imacs_app.slow_requests', 'WARNING') as logs:
+            self.client.get(self.url)
+        self.assertIn(self.url, logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+class AsyncViewsMixin:
+    async_views = {
+        'task_list_todo': views.AsyncTaskListTodo,
+        'task_list_summary': views.AsyncTaskListSummary,
+        'task_list_my_tasks': views.AsyncTaskListMyTasks,
+        'task_list_completions': views.AsyncTaskListCompletions,
+    }
+
+    nb_tasks = 12
+    nb_done_per_task = 4 # more completions than a page
+
+    def get_async(self, name, user, **params):
+        url = reverse(f'imacs_app:{name}', kwargs={'task_list_id': self.task_list.pk})
+        request = AsyncRequestFactory().get(f'{url}?{urlencode(params)}')
+        request.user = user
+        view = self.async_views[name].as_view()
+        async def get():
+            return await view(request, task_list_id=self.task_list.pk)
+        response = async_to_sync(get)()
+        return response.render() if hasattr(response, 'render') else response
+
+    def assertSameContent(self, sync_response, async_response):
+        def strip_csrf(content):
+            # The full precision priorities drift between the two requests
+            return re.sub(r'value="[^"]{64}"|data-priority="[^"]*"', '', content.decode())
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(strip_csrf(async_response.content), strip_csrf(sync_response.content))
+
+@override_settings(IMACS_ASYNC_CONCURRENT_QUERIES=False)
+class AsyncViewsTests(AsyncViewsMixin, ImacsTestCase):
+    def test_same_content_as_sync_views(self):
+        for name in self.async_views:
+            with self.subTest(name):
+                sync_response = self.client.get(reverse(f'imacs_app:{name}', kwargs={'task_list_id': self.task_list.pk}))
+                self.assertSameContent(sync_response, self.get_async(name, self.user))
+        sync_response = self.client.get(reverse('imacs_app:task_list_completions', kwargs={'task_list_id': self.task_list.pk}), {'fragment': 'rows'})
+        async_response = self.get_async('task_list_completions', self.user, fragment='rows')
+        self.assertSameContent(sync_response, async_response)
+        self.assertEqual(async_response['X-Next-Cursor'], sync_response['X-Next-Cursor'])
+
+    def test_completions_show_rollups(self):
+        rollup.compact(timezone.now())
+        sync_response = self.client.get(reverse('imacs_app:task_list_completions', kwargs={'task_list_id': self.task_list.pk}))
+        async_response = self.get_async('task_list_completions', self.user)
+        self.assertContains(async_response, "Week du")
+        self.assertSameContent(sync_response, async_response)
+
+    def test_permission(self):
+        bob = User.objects.create_user("bob", password="bob")
+        for name in self.async_views:
+            with self.subTest(name):
+                with self.assertRaises(PermissionDenied):
+                    self.get_async(name, bob)
+                self.assertEqual(self.get_async(name, AnonymousUser()).status_code, 302)
+
+class AsyncViewsConcurrentQueriesTests(AsyncViewsMixin, ImacsTransactionTestCase):
+    """The concurrent queries run on other connections, which only see committed data"""
+    def test_same_content_as_sync_views(self):
+        threads = set()
+        def record_thread(execute, sql, params, many, context):
+            threads.add(threading.get_ident())
+            return execute(sql, params, many, context)
+        with patch.object(middleware, 'current_query_recorder', contextvars.ContextVar('test', default=record_thread)):
+            async_response = self.get_async('task_list_todo', self.user)
+        # The todo list and the stats were queried in parallel
+        self.assertGreater(len(threads), 1)
+        cache.clear()
+        self.assertSameContent(self.client.get(reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.task_list.pk})), async_response)
+
+class RecordingBackend:
+    """Events backend keeping the published messages"""
+    def __init__(self):
+        self.published = []
+    def has_subscribers(self, channel):
+        return True
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+@override_settings(IMACS_EVENTS_BACKEND='imacs_app.tests.RecordingBackend')
+class LiveUpdatesTests(ImacsTestCase):
+    nb_tasks = 6
+
+    def setUp(self):
+        super().setUp()
+        self.tasks = list(Task.objects.filter(task_category__task_list=self.task_list).order_by('pk'))
+        self.channel = events.channel_name(self.task_list.pk)
+        events.get_backend.cache_clear() # a new RecordingBackend
+
+    def published_tasks(self):
+        return [message['data'] for channel, message in events.get_backend().published if channel == self.channel]
+
+    def test_signals_publish_patches_on_commit(self):
+        task = self.tasks[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('imacs_app:task_done_add_now', kwargs={'task_id': task.pk, 'next': 'todo'}), {'duration': 5})
+            self.assertEqual(self.published_tasks(), [])
+        patch = self.published_tasks()[-1]['tasks'][0]
+        self.assertEqual(patch['id'], task.pk)
+        self.assertIsNone(patch['tasked_user'])
+        self.assertAlmostEqual(patch['priority'], 0, places=2)
+        self.assertEqual(patch['last_done'], Task.objects.get(pk=task.pk).last_done_at.isoformat())
+
+        task_id = task.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            task.delete()
+        self.assertEqual(self.published_tasks()[-1], {'tasks': [], 'removed': [task_id]})
+
+    def test_one_task_list_lookup_per_change(self):
+        # Shared by the receivers of the cache versions and of the live updates
+        def lookups(queries):
+            return [query['sql'] for query in queries if query['sql'].startswith('SELECT') and '"task_list_id"' in query['sql']]
+        for change in [lambda: TaskDone.objects.create(task=self.tasks[0]), lambda: self.tasks[0].taskdone_set.last().delete(), lambda: self.tasks[1].save()]:
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks():
+                change()
+            self.assertEqual(len(lookups(queries)), 1)
+
+    def test_no_publication_without_subscribers(self):
+        with self.settings(IMACS_EVENTS_BACKEND='imacs_app.events.LocalBackend'):
+            with self.captureOnCommitCallbacks() as callbacks:
+                TaskDone.objects.create(task=self.tasks[0])
+            self.assertEqual(callbacks, [])
+
+    def test_bulk_operations_publish(self):
+        pks = [task.pk for task in self.tasks[1:4]]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('imacs_app:task_list_bulk_assign', kwargs={'task_list_id': self.task_list.pk}), {'tasks': pks, 'tasked_user': self.user.pk})
+        patches = self.published_tasks()[-1]['tasks']
+        self.assertEqual(sorted(patch['id'] for patch in patches), pks)
+        self.assertEqual({patch['tasked_user'] for patch in patches}, {"alice"})
+
+    def test_fallback_view(self):
+        response = self.client.get(reverse('imacs_app:task_list_events', kwargs={'task_list_id': self.task_list.pk}))
+        self.assertEqual(response.status_code, 204)
+        todo_url = reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.task_list.pk})
+        self.assertNotContains(self.client.get(todo_url), 'data-events')
+        with self.settings(IMACS_LIVE_UPDATES=True):
+            self.assertContains(self.client.get(todo_url), 'data-events')
+
+class EventsApplicationTests(ImacsTestCase):
+    nb_tasks = 2
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('imacs_app:task_list_events', kwargs={'task_list_id': self.task_list.pk})
+        # Like the test client, keep the connection of the test transaction
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+
+    def communicator(self, cookies):
+        application = events.EventsApplication(None)
+        cookie = '; '.join(f'{key}={morsel.value}' for key, morsel in cookies.items()).encode()
+        scope = {'type': 'http', 'method': 'GET', 'path': self.url, 'query_string': b'', 'headers': [(b'cookie', cookie)]}
+        return ApplicationCommunicator(application, scope)
+
+    def test_stream(self):
+        async def run():
+            communicator = self.communicator(self.client.cookies)
+            await communicator.send_input({'type': 'http.request'})
+            start = await communicator.receive_output(5)
+            self.assertEqual(start['status'], 200)
+            self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+            self.assertEqual((await communicator.receive_output(5))['body'], b': connected\n\n')
+            channel = events.channel_name(self.task_list.pk)
+            self.assertTrue(events.get_backend().has_subscribers(channel))
+            # Published from another thread, like the signals of a request
+            await sync_to_async(events.get_backend().publish, thread_sensitive=False)(channel, {'event': 'tasks', 'data': {'tasks': [], 'removed': [1]}})
+            body = (await communicator.receive_output(5))['body']
+            self.assertEqual(body, b'event: tasks\ndata: {"tasks": [], "removed": [1]}\n\n')
+            await communicator.send_input({'type': 'http.disconnect'})
+            await communicator.wait(5)
+            self.assertFalse(events.get_backend().has_subscribers(channel))
+        async_to_sync(run)()
+
+    def test_forbidden(self):
+        async def run():
+            communicator = self.communicator({})
+            await communicator.send_input({'type': 'http.request'})
+            self.assertEqual((await communicator.receive_output(5))['status'], 403)
+        async_to_sync(run)()
+
+    def test_local_backend_overflow(self):
+        backend = events.LocalBackend(max_pending=2)
+        async def run():
+            async with backend.subscribe('channel') as subscription:
+                for i in range(3):
+                    backend.publish('channel', {'event': 'tasks', 'data': i})
+                await asyncio.sleep(0)
+                self.assertEqual(await subscription.get(), {'event': 'reload'})
+        async_to_sync(run)()
@@ -0,0 +1,224 @@
+"""Export and import of whole task lists (categories, tasks and completion history).
+
+A task list is serialized as a sequence of records: the task list, then its
+categories, its tasks, the rollups of its compacted history (see rollup.py) and
+finally its completions, each record referring to its
+parent by the primary key it had on the exporting instance. Users are referred to
+by username. The records are written either as NDJSON (one JSON object per line)
+or as CSV with the `CSV_COLUMNS` columns.
+
+Both directions stream: the export iterates over the completions in chunks and the
+import inserts them in batches, so memory does not grow with the history.
+"""
+
+import csv
+import json
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, models, transaction
+from django.db.models.functions import Coalesce
+
+from .models import TaskList, TaskCategory, Task, TaskDone, TaskDoneRollup
+from .caching import bump_version
+
+FORMATS = ['ndjson', 'csv']
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+CSV_COLUMNS = ['type', 'id', 'parent', 'name', 'description', 'duration', 'period', 'user', 'when', 'count', 'start']
+
+class TransferError(Exception):
+    pass
+
+def record_error(record, error):
+    """TransferError for a record whose fields are missing or invalid"""
+    if isinstance(error, KeyError):
+        reason = f"missing field {error}"
+    elif isinstance(error, ValidationError):
+        reason = '; '.join(f"{field}: {' '.join(messages)}" for field, messages in error.message_dict.items())
+    else:
+        reason = str(error)
+    return TransferError(f"Invalid {record.get('type')} record {record.get('id')}: {reason}")
+
+def export_records(task_list, chunk_size=2000):
+    yield {'type': 'task_list', 'id': task_list.pk, 'name': task_list.name, 'users': [user.username for user in task_list.users.order_by('pk')]}
+    for task_category in task_list.taskcategory_set.order_by('pk'):
+        yield {'type': 'category', 'id': task_category.pk, 'parent': task_category.task_list_id, 'name': task_category.name}
+    tasks = (Task.objects.filter(task_category__task_list=task_list).order_by('pk')
+        .values_list('pk', 'task_category_id', 'name', 'description', 'duration', 'period', 'tasked_user__username', 'last_done_at'))
+    for pk, task_category_id, name, description, duration, period, username, last_done_at in tasks.iterator(chunk_size=chunk_size):
+        yield {'type': 'task', 'id': pk, 'parent': task_category_id, 'name': name, 'description': description, 'duration': duration, 'period': period, 'user': username,
+            'when': last_done_at.isoformat() if last_done_at else None}
+    rollups = (TaskDoneRollup.objects.filter(task__task_category__task_list=task_list).order_by('pk')
+        .values_list('pk', 'task_id', 'period', 'period_start', 'count', 'duration', 'last_done'))
+    for pk, task_id, period, period_start, count, duration, last_done in rollups.iterator(chunk_size=chunk_size):
+        yield {'type': 'rollup', 'id': pk, 'parent': task_id, 'name': period, 'start': period_start.isoformat(), 'count': count, 'duration': duration, 'when': last_done.isoformat()}
+    task_dones = (TaskDone.objects.filter(task__task_category__task_list=task_list).order_by('pk')
+        .values_list('pk', 'task_id', 'when', 'duration'))
+    for pk, task_id, when, duration in task_dones.iterator(chunk_size=chunk_size):
+        yield {'type': 'done', 'id': pk, 'parent': task_id, 'when': when.isoformat(), 'duration': duration}
+
+class Echo:
+    """File-like object returning what is written, to stream the output of csv.writer"""
+    def write(self, value):
+        return value
+
+def export_lines(task_list, format, chunk_size=2000):
+    records = export_records(task_list, chunk_size)
+    if format == 'ndjson':
+        for record in records:
+            yield json.dumps(record) + '\n'
+    elif format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(CSV_COLUMNS)
+        for record in records:
+            if record['type'] == 'task_list':
+                # The members are stored in the `user` column, separated by spaces
+                record = dict(record, user=' '.join(record['users']))
+            yield writer.writerow(['' if record.get(column) is None else record[column] for column in CSV_COLUMNS])
+    else:
+        raise ValueError(f"Unknown format {format}")
+
+def parse_lines(lines, format):
+    """Records of the lines of an export, TransferError if they are not UTF-8 or not valid JSON or CSV"""
+    try:
+        if format == 'ndjson':
+            for line in lines:
+                if line.strip():
+                    record = json.loads(line)
+                    if not isinstance(record, dict):
+                        raise TransferError(f"Invalid record {line.strip()[:50]}: not an object")
+                    yield record
+        elif format == 'csv':
+            # strict: an unterminated quote is an error, not a field running to the end of the file
+            for row in csv.DictReader(lines, strict=True):
+                record = {column: (row.get(column) or None) for column in CSV_COLUMNS}
+                try:
+                    for column in ['id', 'parent', 'duration', 'period', 'count']:
+                        if record[column] is not None:
+                            record[column] = int(record[column])
+                except ValueError as error:
+                    raise record_error(record, error) from error
+                if record['type'] == 'task_list':
+                    record['users'] = (record['user'] or '').split()
+                yield record
+        else:
+            raise ValueError(f"Unknown format {format}")
+    except UnicodeDecodeError as error:
+        raise TransferError(f"Not UTF-8: {error}") from error
+    except (csv.Error, json.JSONDecodeError) as error:
+        raise TransferError(f"Not {format}: {error}") from error
+
+@transaction.atomic
+def import_records(records, owner=None, name=None, batch_size=2000):
+    """Create a new task list from exported records and return it.
+
+    The primary keys of the records are remapped to the new rows. Users which do not
+    exist on this instance are dropped from the members and the tasked users, and
+    `owner` is always made a member.
+    """
+    records = iter(records)
+    record = next(records, None)
+    if record is None or record['type'] != 'task_list':
+        raise TransferError("The export must start with the task list")
+    task_list = TaskList.objects.create(name=name or record['name'])
+    users = {user.username: user for user in User.objects.filter(username__in=record.get('users', []))}
+    task_list.users.add(*users.values())
+    if owner is not None:
+        task_list.users.add(owner)
+
+    category_ids = {}
+    task_ids = {}
+    pending_tasks = []
+    pending_task_dones = []
+    pending_rollups = []
+
+    def flush_tasks():
+        # Not every backend sets the primary keys in bulk_create: the new list only has
+        # these tasks and they are inserted in order, so they are read back by primary key
+        Task.objects.bulk_create([task for old_pk, task in pending_tasks], batch_size=batch_size)
+        new_pks = Task.objects.filter(task_category__task_list=task_list).order_by('pk').values_list('pk', flat=True)
+        for (old_pk, task), new_pk in zip(pending_tasks, new_pks):
+            task_ids[old_pk] = new_pk
+        pending_tasks.clear()
+
+    # The records are validated one by one with the validation of the models (which also
+    # parses the dates), so that a malformed export fails with the record at fault
+    # instead of an error of the database when its batch is inserted
+    try:
+        for record in records:
+            try:
+                if record['type'] == 'category':
+                    task_category = TaskCategory(task_list=task_list, name=record['name'])
+                    task_category.clean_fields(exclude=['task_list'])
+                    task_category.save()
+                    category_ids[record['id']] = task_category.pk
+                elif record['type'] == 'task':
+                    if task_ids:
+                        raise TransferError("The tasks must come before the completions")
+                    try:
+                        task_category_id = category_ids[record['parent']]
+                    except KeyError:
+                        raise TransferError(f"Task {record['id']} refers to an unknown category")
+                    task = Task(
+                        task_category_id=task_category_id,
+                        name=record['name'],
+                        description=record['description'] or '',
+                        duration=record['duration'],
+                        period=record['period'],
+                        tasked_user=users.get(record['user']),
+                        last_done_at=record.get('when'),
+                    )
+                    task.clean_fields(exclude=['task_category', 'description', 'tasked_user'])
+                    pending_tasks.append((record['id'], task))
+                elif record['type'] in ['rollup', 'done']:
+                    if pending_tasks:
+                        flush_tasks()
+                    try:
+                        task_id = task_ids[record['parent']]
+                    except KeyError:
+                        raise TransferError(f"Completion {record['id']} refers to an unknown task")
+                    if record['type'] == 'rollup':
+                        rollup = TaskDoneRollup(
+                            task_id=task_id,
+                            period=record['name'],
+                            period_start=record['start'],
+                            count=record['count'],
+                            duration=record['duration'],
+                            last_done=record['when'],
+                        )
+                        rollup.clean_fields(exclude=['task'])
+                        pending_rollups.append(rollup)
+                        if len(pending_rollups) >= batch_size:
+                            TaskDoneRollup.objects.bulk_create(pending_rollups)
+                            pending_rollups.clear()
+                        continue
+                    task_done = TaskDone(task_id=task_id, task_list=task_list, when=record['when'], duration=record['duration'])
+                    task_done.clean_fields(exclude=['task', 'task_list'])
+                    pending_task_dones.append(task_done)
+                    if len(pending_task_dones) >= batch_size:
+                        TaskDone.objects.bulk_create(pending_task_dones)
+                        pending_task_dones.clear()
+                else:
+                    raise TransferError(f"Unknown record type {record['type']}")
+            except (KeyError, TypeError, ValueError, ValidationError) as error:
+                raise record_error(record, error) from error
+        if pending_tasks:
+            flush_tasks()
+        TaskDoneRollup.objects.bulk_create(pending_rollups)
+        TaskDone.objects.bulk_create(pending_task_dones)
+    except DatabaseError as error:
+        # What the validation of the fields does not see, e.g. two rollups of the same period
+        raise TransferError(str(error)) from error
+
+    # bulk_create bypasses TaskDone.save, which maintains Task.last_done_at: it comes with the
+    # tasks, otherwise it is recomputed
+    newest_done = TaskDone.objects.filter(task=models.OuterRef('pk')).order_by('-when').values('when')[:1]
+    newest_rollup = TaskDoneRollup.objects.filter(task=models.OuterRef('pk')).order_by('-last_done').values('last_done')[:1]
+    tasks = Task.objects.filter(task_category__task_list=task_list, last_done_at=None)
+    tasks.update(last_done_at=Coalesce(models.Subquery(newest_done), models.Subquery(newest_rollup)))
+    # Neither does it send the signals which invalidate the cache
+    transaction.on_commit(lambda: bump_version(task_list.pk))
+    return task_list
+
+def import_lines(lines, format, owner=None, name=None, batch_size=2000):
+    return import_records(parse_lines(lines, format), owner, name, batch_size)
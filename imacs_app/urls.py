@@ -1,17 +1,32 @@
+from django.conf import settings
 from django.urls import path, include
 
 from . import views
 import django.contrib.auth.views as auth_views
 
 app_name = 'imacs_app'
+
+def read_view(view, async_view):
+    """The read-heavy views have an async version, served with `IMACS_ASYNC_VIEWS` (for ASGI deployments)"""
+    return (async_view if getattr(settings, 'IMACS_ASYNC_VIEWS', False) else view).as_view()
+
 urlpatterns = [
     path('', views.TaskListList.as_view(), name='task_list_list'),
     path('task_list/create', views.TaskListCreate.as_view(), name='task_list_create'),
-    path('task_list/<int:task_list_id>/summary', views.TaskListSummary.as_view(), name='task_list_summary'),
-    path('task_list/<int:task_list_id>/todo', views.TaskListTodo.as_view(), name='task_list_todo'),
-    path('task_list/<int:task_list_id>/my_tasks', views.TaskListMyTasks.as_view(), name='task_list_my_tasks'),
-    path('task_list/<int:task_list_id>/completions', views.TaskListCompletions.as_view(), name='task_list_completions'),
+    path('task_list/import', views.TaskListImport.as_view(), name='task_list_import'),
+    path('task_list/<int:task_list_id>/summary', read_view(views.TaskListSummary, views.AsyncTaskListSummary), name='task_list_summary'),
+    path('task_list/<int:task_list_id>/todo', read_view(views.TaskListTodo, views.AsyncTaskListTodo), name='task_list_todo'),
+    path('task_list/<int:task_list_id>/my_tasks', read_view(views.TaskListMyTasks, views.AsyncTaskListMyTasks), name='task_list_my_tasks'),
+    path('task_list/<int:task_list_id>/events', views.TaskListEvents.as_view(), name='task_list_events'),
+    path('task_list/<int:task_list_id>/todo.json', views.TaskListApiTodo.as_view(), name='task_list_api_todo'),
+    path('task_list/<int:task_list_id>/bulk_done', views.TaskListBulkDone.as_view(), name='task_list_bulk_done'),
+    path('task_list/<int:task_list_id>/bulk_assign', views.TaskListBulkAssign.as_view(), name='task_list_bulk_assign'),
+    path('task_list/<int:task_list_id>/auto_assign', views.TaskListAutoAssign.as_view(), name='task_list_auto_assign'),
+    path('task_list/<int:task_list_id>/forecast', views.TaskListForecast.as_view(), name='task_list_forecast'),
+    path('task_list/<int:task_list_id>/forecast.json', views.TaskListApiForecast.as_view(), name='task_list_api_forecast'),
+    path('task_list/<int:task_list_id>/completions', read_view(views.TaskListCompletions, views.AsyncTaskListCompletions), name='task_list_completions'),
     path('task_list/<int:task_list_id>/modify', views.TaskListModify.as_view(), name='task_list_modify'),
+    path('task_list/<int:task_list_id>/export', views.TaskListExport.as_view(), name='task_list_export'),
     path('task_list/<int:task_list_id>/delete', views.TaskListDelete.as_view(), name='task_list_delete'),
     path('task_list/<int:task_list_id>/create_task', views.TaskCreate.as_view(), name='task_list_create_task'),
     path('task_list/<int:task_list_id>/create_category', views.TaskCategoryCreate.as_view(), name='task_list_create_task_category'),
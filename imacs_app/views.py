@@ -1,33 +1,107 @@
-from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_headers
 from django.urls import reverse
 from django.views import generic
 from django.forms import models as model_forms
 from django import forms
 from django.contrib import auth
 from django.contrib.auth.mixins import UserPassesTestMixin, LoginRequiredMixin
+from django.db import transaction, close_old_connections
+from django.db.models import Prefetch
+from django.core.exceptions import SuspiciousOperation
+from django.utils import timezone
+from django.conf import settings
+from asgiref.sync import sync_to_async
+import asyncio
+import codecs
+from functools import wraps
+from operator import attrgetter
+
+from .models import TaskList, TaskCategory, Task, TaskDone, TaskDoneRollup
+from . import assignment, authentication, events, pagination, transfer
+from .caching import cached, cached_todo, cached_stats, get_version, get_last_modified, get_timeout, bump_version
+
+class UserCanViewMixin(UserPassesTestMixin):
+    """Check that the user can view the object of the url and load it, in a single query.
+
+    The object is memoized for the rest of the request, and returned by `get_object`
+    when the view is about the same model. With IMACS_FAST_AUTH, the memberships of
+    the user come from the cache instead (see authentication.py).
+    """
+    permission_model = None
+    permission_url_kwarg = None
+    permission_users_lookup = None
+    permission_task_list_attr = None # of the object, for the cached memberships
+    permission_select_related = []
+
+    def get_permitted_object(self):
+        if not hasattr(self, '_permitted_object'):
+            self._permitted_object = None
+            if self.request.user.is_authenticated:
+                if authentication.is_enabled():
+                    self._permitted_object = self.get_member_object()
+                else:
+                    self._permitted_object = (self.permission_model.objects
+                        .filter(**{'pk': self.kwargs[self.permission_url_kwarg], self.permission_users_lookup: self.request.user})
+                        .select_related(*self.permission_select_related)
+                        .first())
+        return self._permitted_object
+
+    def get_member_object(self):
+        obj = (self.permission_model.objects
+            .filter(pk=self.kwargs[self.permission_url_kwarg])
+            .select_related(*self.permission_select_related)
+            .first())
+        if obj is None or attrgetter(self.permission_task_list_attr)(obj) not in authentication.get_task_list_ids(self.request.user):
+            return None
+        return obj
 
-from .models import TaskList, TaskCategory, Task, TaskDone
-
-class UserCanViewTaskListMixin(UserPassesTestMixin):
-    def test_func(self):
-        task_id = self.kwargs['task_list_id']
-        return TaskList.objects.filter(pk=task_id, users=self.request.user).exists()
-
-class UserCanViewTaskCategoryMixin(UserPassesTestMixin):
     def test_func(self):
-        task_category_id = self.kwargs['task_category_id']
-        return TaskCategory.objects.filter(pk=task_category_id, task_list__users=self.request.user).exists()
-
-class UserCanViewTaskMixin(UserPassesTestMixin):
-    def test_func(self):
-        task_id = self.kwargs['task_id']
-        return Task.objects.filter(pk=task_id, task_category__task_list__users=self.request.user).exists()
-
-class UserCanViewTaskDoneMixin(UserPassesTestMixin):
-    def test_func(self):
-        task_done_id = self.kwargs['task_done_id']
-        return TaskDone.objects.filter(pk=task_done_id, task__task_category__task_list__users=self.request.user).exists()
+        return self.get_permitted_object() is not None
+
+    def get_object(self, queryset=None):
+        if queryset is None and getattr(self, 'model', None) is self.permission_model:
+            return self.get_permitted_object()
+        return super().get_object(queryset)
+
+class UserCanViewTaskListMixin(UserCanViewMixin):
+    permission_model = TaskList
+    permission_url_kwarg = 'task_list_id'
+    permission_users_lookup = 'users'
+    permission_task_list_attr = 'pk'
+
+    def get_member_object(self):
+        task_list_id = self.kwargs[self.permission_url_kwarg]
+        if task_list_id not in authentication.get_task_list_ids(self.request.user):
+            return None
+        # Cached until the list changes, like its pages (see caching.py)
+        return cached(task_list_id, 'task_list', lambda: TaskList.objects.filter(pk=task_list_id).first())
+
+class UserCanViewTaskCategoryMixin(UserCanViewMixin):
+    permission_model = TaskCategory
+    permission_url_kwarg = 'task_category_id'
+    permission_users_lookup = 'task_list__users'
+    permission_task_list_attr = 'task_list_id'
+    permission_select_related = ['task_list']
+
+class UserCanViewTaskMixin(UserCanViewMixin):
+    permission_model = Task
+    permission_url_kwarg = 'task_id'
+    permission_users_lookup = 'task_category__task_list__users'
+    permission_task_list_attr = 'task_category.task_list_id'
+    permission_select_related = ['task_category__task_list']
+
+class UserCanViewTaskDoneMixin(UserCanViewMixin):
+    permission_model = TaskDone
+    permission_url_kwarg = 'task_done_id'
+    permission_users_lookup = 'task__task_category__task_list__users'
+    permission_task_list_attr = 'task.task_category.task_list_id'
+    permission_select_related = ['task__task_category__task_list']
 
 class TaskListList(generic.ListView):
     template_name = 'imacs_app/task_list_list.html'
@@ -118,7 +192,7 @@ class MultipleFormsMixin(generic.base.ContextMixin):
 class MultipleFormsView(generic.base.TemplateResponseMixin, MultipleFormsMixin, generic.edit.ProcessFormView):
     pass
 
-class TaskListModify(generic.detail.SingleObjectMixin, UserCanViewTaskListMixin, MultipleFormsView):
+class TaskListModify(UserCanViewTaskListMixin, generic.detail.SingleObjectMixin, MultipleFormsView):
     class UserForm(forms.Form):
         user = auth.forms.UsernameField()
         def clean_user(self):
@@ -189,46 +263,360 @@ class TaskListTodo(UserCanViewTaskListMixin, generic.ListView):
     context_object_name = 'tasks'
     def get_queryset(self):
         task_list_id = self.kwargs['task_list_id']
-        self.task_list = get_object_or_404(TaskList, pk=task_list_id)
-        tasks = Task.objects.filter(task_category__task_list__id = task_list_id).all()
-        return sorted(tasks, key=lambda x: x.priority(), reverse=True)
+        self.task_list = self.get_permitted_object()
+        return cached_todo(task_list_id)
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['task_list'] = self.task_list
+        context['stats'] = cached_stats(self.task_list)
+        context['live_updates'] = settings.IMACS_LIVE_UPDATES
+        return context
+
+class TaskListEvents(UserCanViewTaskListMixin, generic.View):
+    """The live updates of the todo page are streamed by `events.EventsApplication`, in front of the ASGI application.
+
+    This view only answers when it is not there (e.g. under WSGI): 204 tells the EventSource not to reconnect.
+    """
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(status=204)
+
+def task_list_api_etag(request, task_list_id):
+    return f'"{task_list_id}-{get_version(task_list_id)}"'
+
+def task_list_api_last_modified(request, task_list_id):
+    return get_last_modified(task_list_id)
+
+def cache_for_timeout(view):
+    """Let the clients reuse the responses (304 included) for `IMACS_CACHE_TIMEOUT` seconds, like the cached todo"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        patch_cache_control(response, private=True, max_age=get_timeout())
+        return response
+    return wrapper
+
+# The compression is outermost: it weakens the ETag of the compressed bodies, so that the
+# strong ETag is only sent with the identity body. The 304 responses are not compressed,
+# hence the explicit Vary.
+@method_decorator([cache_for_timeout, gzip_page, vary_on_headers('Accept-Encoding'),
+    condition(etag_func=task_list_api_etag, last_modified_func=task_list_api_last_modified)], name='get')
+class TaskListApiTodo(UserCanViewTaskListMixin, generic.View):
+    """Prioritized tasks, stats and goals of a task list, as JSON.
+
+    The ETag and Last-Modified headers only depend on the task list version, so
+    conditional requests are answered without computing anything. The priorities
+    drift with time though: they are those of the Date of the response, a client
+    which keeps it longer than its max-age computes them from `last_done` and
+    `period` (days since the last completion / period).
+    """
+    def get(self, request, *args, **kwargs):
+        task_list = self.get_permitted_object()
+        stats = cached_stats(task_list)
+        tasks = cached_todo(task_list.pk)
+        return JsonResponse({
+            'id': task_list.pk,
+            'name': task_list.name,
+            'stats': {
+                'hour_per_week': stats.hour_per_week,
+                'hour_done_since_last_week': stats.hour_done_since_last_week,
+                'remaining_hours_this_week': stats.remaining_hours_this_week,
+                'hour_per_week_per_user': stats.hour_per_week_per_user,
+            },
+            'goals': [{'user': user.username, 'hours': hours} for user, hours in stats.hours_per_user],
+            'tasks': [{
+                'id': task.pk,
+                'category': task.task_category.name,
+                'name': task.name,
+                'duration': task.duration,
+                'period': task.period,
+                'last_done': task.last_done(),
+                'priority': task.annotated_priority, # null when never done
+                'tasked_user': task.tasked_user.username if task.tasked_user else None,
+            } for task in tasks],
+        })
+
+def task_list_bulk_form_factory(task_list_id, done):
+    class TheForm(forms.Form):
+        tasks = forms.ModelMultipleChoiceField(queryset=Task.objects.filter(task_category__task_list__pk=task_list_id))
+    class DoneForm(TheForm):
+        """The completion time and duration can be set for every task with the `when_<task id>` and `duration_<task id>` fields"""
+        when = forms.DateTimeField(required=False)
+        def clean(self):
+            cleaned_data = super().clean()
+            when_field = forms.DateTimeField(required=False)
+            duration_field = forms.IntegerField(required=False, min_value=0)
+            completions = []
+            for task in cleaned_data.get('tasks', []):
+                try:
+                    when = when_field.clean(self.data.get(f'when_{task.pk}')) or cleaned_data.get('when') or timezone.now()
+                    duration = duration_field.clean(self.data.get(f'duration_{task.pk}'))
+                except forms.ValidationError as error:
+                    raise forms.ValidationError(f"{task.name}: {' '.join(error.messages)}")
+                completions.append(TaskDone(task=task, when=when, duration=duration))
+            cleaned_data['completions'] = completions
+            return cleaned_data
+    class AssignForm(TheForm):
+        tasked_user = forms.ModelChoiceField(queryset=auth.models.User.objects.filter(tasklist__pk=task_list_id), required=False)
+    return DoneForm if done else AssignForm
+
+class TaskListBulkMixin(UserCanViewTaskListMixin):
+    template_name = 'imacs_app/task_list_bulk_error.html'
+    http_method_names = ['post']
+
+    def get_success_url(self):
+        return reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.kwargs['task_list_id']})
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['task_list'] = self.get_permitted_object()
         return context
 
+    def form_invalid(self, form):
+        return self.render_to_response(self.get_context_data(form=form), status=400)
+
+class TaskListBulkDone(TaskListBulkMixin, generic.edit.FormView):
+    """Complete several tasks at once and untask them"""
+    def get_form_class(self):
+        return task_list_bulk_form_factory(self.kwargs['task_list_id'], True)
+
+    def form_valid(self, form):
+        tasks = Task.objects.filter(pk__in=[task.pk for task in form.cleaned_data['tasks']])
+        with transaction.atomic():
+            tasks.add_task_dones(form.cleaned_data['completions'], tasked_user=None)
+            events.publish_tasks_on_commit(self.kwargs['task_list_id'], [task.pk for task in form.cleaned_data['tasks']])
+        # Bulk operations do not send the signals which invalidate the cache
+        bump_version(self.kwargs['task_list_id'])
+        return super().form_valid(form)
+
+class TaskListBulkAssign(TaskListBulkMixin, generic.edit.FormView):
+    """Set (or clear) the tasked user of several tasks at once"""
+    def get_form_class(self):
+        return task_list_bulk_form_factory(self.kwargs['task_list_id'], False)
+
+    def form_valid(self, form):
+        tasks = Task.objects.filter(pk__in=[task.pk for task in form.cleaned_data['tasks']])
+        tasks.update(tasked_user=form.cleaned_data['tasked_user'])
+        bump_version(self.kwargs['task_list_id'])
+        events.publish_tasks_on_commit(self.kwargs['task_list_id'], [task.pk for task in form.cleaned_data['tasks']])
+        return super().form_valid(form)
+
+class TaskListAutoAssign(TaskListBulkMixin, generic.edit.FormView):
+    """Spread the due unassigned tasks over the members, see assignment.py"""
+    form_class = forms.Form # empty form
+
+    def form_valid(self, form):
+        assignment.assign(self.get_permitted_object())
+        return super().form_valid(form)
+
+class TaskListExport(UserCanViewTaskListMixin, generic.View):
+    def get(self, request, *args, **kwargs):
+        task_list = self.get_permitted_object()
+        format = request.GET.get('format', 'ndjson')
+        if format not in transfer.FORMATS:
+            return HttpResponseBadRequest(f"Unknown format {format}")
+        response = StreamingHttpResponse(transfer.export_lines(task_list, format), content_type=transfer.CONTENT_TYPES[format])
+        response['Content-Disposition'] = f'attachment; filename="task_list_{task_list.pk}.{format}"'
+        return response
+
+class TaskListImportForm(forms.Form):
+    file = forms.FileField()
+    format = forms.ChoiceField(choices=[(format, format) for format in transfer.FORMATS])
+    name = forms.CharField(max_length=200, required=False)
+
+class TaskListImport(LoginRequiredMixin, generic.edit.FormView):
+    template_name = 'imacs_app/task_list_import.html'
+    form_class = TaskListImportForm
+
+    def form_valid(self, form):
+        lines = codecs.iterdecode(form.cleaned_data['file'], 'utf-8')
+        try:
+            self.task_list = transfer.import_lines(lines, form.cleaned_data['format'], self.request.user, form.cleaned_data['name'])
+        except (transfer.TransferError, ValueError, KeyError) as error:
+            form.add_error('file', f"Invalid export: {error}")
+            return self.form_invalid(form)
+        return super().form_valid(form)
+
+    def get_success_url(self):
+        return reverse('imacs_app:task_list_summary', kwargs={'task_list_id': self.task_list.id})
+
 class TaskListSummary(UserCanViewTaskListMixin, generic.DetailView):
     model = TaskList
     template_name = 'imacs_app/task_list_summary.html'
     context_object_name = 'task_list'
     pk_url_kwarg = 'task_list_id'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['task_categories'] = cached(self.object.pk, 'summary', self.get_task_categories)
+        context['minute_per_day'] = sum(task_category.minute_per_day() for task_category in context['task_categories'])
+        return context
+
+    def get_task_categories(self):
+        tasks = Task.objects.with_priority().order_by('pk')
+        return list(self.object.taskcategory_set.order_by('pk').prefetch_related(Prefetch('task_set', queryset=tasks)))
+
 class TaskListMyTasks(UserCanViewTaskListMixin, generic.ListView):
     template_name = 'imacs_app/task_list_my_tasks.html'
     context_object_name = 'tasks'
     def get_queryset(self):
         task_list_id = self.kwargs['task_list_id']
-        self.task_list = get_object_or_404(TaskList, pk=task_list_id)
-        tasks = Task.objects.filter(task_category__task_list__id = task_list_id, tasked_user = self.request.user).all()
-        return sorted(tasks, key=lambda x: x.priority(), reverse=True)
+        self.task_list = self.get_permitted_object()
+        user = self.request.user
+        return cached(task_list_id, f'my_tasks:{user.pk}', lambda: list(Task.objects.filter(task_category__task_list__id = task_list_id, tasked_user = user).by_priority()))
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['task_list'] = self.task_list
         return context
 
-class TaskListCompletions(UserCanViewTaskListMixin, generic.ListView):
+class TaskListForecastMixin(UserCanViewTaskListMixin):
+    """The forecast of the task list over `?weeks=` weeks (4 by default)"""
+    def get_forecast(self):
+        # NumPy is only needed here: the other views also run without it (e.g. under WSGI, see module.nix)
+        from . import forecast
+        try:
+            weeks = int(self.request.GET.get('weeks', 4))
+        except ValueError:
+            raise SuspiciousOperation("Invalid number of weeks")
+        if not 1 <= weeks <= forecast.MAX_WEEKS:
+            raise SuspiciousOperation(f"The number of weeks must be between 1 and {forecast.MAX_WEEKS}")
+        return forecast.Forecast(self.get_permitted_object(), weeks)
+
+class TaskListForecast(TaskListForecastMixin, generic.TemplateView):
+    template_name = 'imacs_app/task_list_forecast.html'
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['task_list'] = self.get_permitted_object()
+        context['forecast'] = self.get_forecast()
+        return context
+
+class TaskListApiForecast(TaskListForecastMixin, generic.View):
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(self.get_forecast().as_dict())
+
+class LoadMoreMixin:
+    """Render only `rows_template_name` for the "load more" requests (`?fragment=rows`), with the next cursor in a header"""
+    rows_template_name = None
+
+    def get_template_names(self):
+        if self.request.GET.get('fragment') == 'rows':
+            return [self.rows_template_name]
+        return super().get_template_names()
+
+    def render_to_response(self, context, **kwargs):
+        response = super().render_to_response(context, **kwargs)
+        if context.get('next_cursor'):
+            response['X-Next-Cursor'] = context['next_cursor']
+        return response
+
+class TaskListCompletions(UserCanViewTaskListMixin, LoadMoreMixin, generic.ListView):
     template_name = 'imacs_app/task_list_completions.html'
+    rows_template_name = 'imacs_app/task_list_completions_rows.html'
     context_object_name = 'task_dones'
+    page_size = 30
+    rollups_cursor_prefix = 'rollups-'
     def get_queryset(self):
         task_list_id = self.kwargs['task_list_id']
-        self.task_list = get_object_or_404(TaskList, pk=task_list_id)
-        task_dones = TaskDone.objects.filter(task__task_category__task_list__id = task_list_id).order_by('-when').all()[:30]
+        self.task_list = self.get_permitted_object()
+        after = self.request.GET.get('after')
+        if after and after.startswith(self.rollups_cursor_prefix):
+            # Past the last completion, only rollups are left
+            self.next_cursor = None
+            return []
+        task_dones = TaskDone.objects.filter(task_list_id=task_list_id).select_related('task__task_category')
+        task_dones, self.next_cursor = pagination.get_page(task_dones, after, self.page_size)
         return task_dones
+    def get_rollups(self):
+        """A page of the rollups, which follow the last completion, and the cursor of the next one."""
+        # The older history has been compacted, see rollup.py
+        after = self.request.GET.get('after')
+        if after and after.startswith(self.rollups_cursor_prefix):
+            after = after[len(self.rollups_cursor_prefix):]
+        else:
+            after = None
+        rollups = TaskDoneRollup.objects.filter(task__task_category__task_list__id = self.kwargs['task_list_id']).select_related('task__task_category')
+        rollups, next_cursor = pagination.get_page(rollups, after, self.page_size, field='last_done')
+        return rollups, next_cursor and self.rollups_cursor_prefix + next_cursor
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['task_list'] = self.task_list
+        context['next_cursor'] = self.next_cursor
+        if self.next_cursor is None:
+            context['rollups'], context['next_cursor'] = self.get_rollups()
         return context
 
+def in_own_connection(func):
+    def wrapper():
+        try:
+            return func()
+        finally:
+            # Like at the end of a request, as the worker thread outlives it
+            close_old_connections()
+    return wrapper
+
+async def gather_queries(*funcs):
+    """Call the functions (which use the ORM) concurrently and return their results.
+
+    Each function runs in its own worker thread, hence with its own database connection.
+    With `IMACS_ASYNC_CONCURRENT_QUERIES = False` they run one after the other in the
+    thread of the request instead, e.g. to see the data of a test transaction.
+    """
+    if not getattr(settings, 'IMACS_ASYNC_CONCURRENT_QUERIES', True):
+        return await sync_to_async(lambda: [func() for func in funcs])()
+    return await asyncio.gather(*[sync_to_async(in_own_connection(func), thread_sensitive=False)() for func in funcs])
+
+class AsyncViewMixin:
+    """Serve a class based view with an async `get`, which Django 3.2 does not support by itself.
+
+    The permission check of the access mixins (and anything else in `dispatch`) queries
+    the database, so `dispatch` runs in a thread and the handler it returns is awaited.
+    """
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Tells the handler to await the view
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        response = await sync_to_async(super().dispatch)(request, *args, **kwargs)
+        if asyncio.iscoroutine(response):
+            response = await response
+        return response
+
+class AsyncTaskListTodo(AsyncViewMixin, TaskListTodo):
+    async def get(self, request, *args, **kwargs):
+        task_list = self.get_permitted_object()
+        tasks, stats = await gather_queries(lambda: cached_todo(task_list.pk), lambda: cached_stats(task_list))
+        self.object_list = tasks
+        return self.render_to_response({'view': self, 'task_list': task_list, 'tasks': tasks, 'stats': stats, 'live_updates': settings.IMACS_LIVE_UPDATES})
+
+class AsyncTaskListSummary(AsyncViewMixin, TaskListSummary):
+    async def get(self, request, *args, **kwargs):
+        self.object = self.get_permitted_object()
+        task_categories, = await gather_queries(lambda: cached(self.object.pk, 'summary', self.get_task_categories))
+        return self.render_to_response({
+            'view': self,
+            'object': self.object,
+            'task_list': self.object,
+            'task_categories': task_categories,
+            'minute_per_day': sum(task_category.minute_per_day() for task_category in task_categories),
+        })
+
+class AsyncTaskListMyTasks(AsyncViewMixin, TaskListMyTasks):
+    async def get(self, request, *args, **kwargs):
+        tasks, = await gather_queries(self.get_queryset)
+        self.object_list = tasks
+        return self.render_to_response({'view': self, 'task_list': self.task_list, 'tasks': tasks})
+
+class AsyncTaskListCompletions(AsyncViewMixin, TaskListCompletions):
+    async def get(self, request, *args, **kwargs):
+        task_dones, = await gather_queries(self.get_queryset)
+        self.object_list = task_dones
+        context = {'view': self, 'task_list': self.task_list, 'task_dones': task_dones, 'next_cursor': self.next_cursor}
+        if self.next_cursor is None:
+            (context['rollups'], context['next_cursor']), = await gather_queries(self.get_rollups)
+        return self.render_to_response(context)
+
 class TaskCategoryCreate(UserCanViewTaskListMixin, generic.edit.CreateView):
     model = TaskCategory
     template_name = 'imacs_app/task_category_create.html'
@@ -236,7 +624,7 @@ class TaskCategoryCreate(UserCanViewTaskListMixin, generic.edit.CreateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['task_list'] = get_object_or_404(TaskList, pk=self.kwargs['task_list_id'])
+        context['task_list'] = self.get_permitted_object()
         return context
 
     def get_success_url(self):
@@ -254,7 +642,7 @@ class TaskCategoryModify(UserCanViewTaskCategoryMixin, generic.edit.UpdateView):
     context_object_name = 'task_category'
 
     def get_success_url(self):
-        return reverse('imacs_app:task_list_summary', kwargs={'task_list_id': self.object.task_list.id})
+        return reverse('imacs_app:task_list_summary', kwargs={'task_list_id': self.object.task_list_id})
 
 class TaskCategoryDelete(UserCanViewTaskCategoryMixin, generic.edit.DeleteView):
     model = TaskCategory
@@ -262,11 +650,11 @@ class TaskCategoryDelete(UserCanViewTaskCategoryMixin, generic.edit.DeleteView):
     context_object_name = 'task_category'
     pk_url_kwarg = 'task_category_id'
     def get_success_url(self):
-        return reverse('imacs_app:task_list_summary', kwargs={'task_list_id': self.object.task_list.id})
+        return reverse('imacs_app:task_list_summary', kwargs={'task_list_id': self.object.task_list_id})
 
 def task_model_form_factory(task_list_id, include_random_completion_checkbox):
     class TheForm(model_forms.ModelForm):
-        task_category = forms.ModelChoiceField(queryset=TaskCategory.objects.filter(task_list__pk=task_list_id))
+        task_category = forms.ModelChoiceField(queryset=TaskCategory.objects.filter(task_list__pk=task_list_id).select_related('task_list'))
         tasked_user = forms.ModelChoiceField(queryset=auth.models.User.objects.filter(tasklist__pk=task_list_id), required=False)
         class Meta:
             model = Task
@@ -283,9 +671,7 @@ class TaskCreate(UserCanViewTaskListMixin, generic.edit.CreateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        task_list_id = self.kwargs['task_list_id']
-        task_list = get_object_or_404(TaskList, pk=task_list_id)
-        context['task_list'] = task_list
+        context['task_list'] = self.get_permitted_object()
         return context
 
     def form_valid(self, form):
@@ -298,24 +684,26 @@ class TaskCreate(UserCanViewTaskListMixin, generic.edit.CreateView):
     def get_form_class(self):
         return task_model_form_factory(self.kwargs['task_list_id'], True)
 
-class TaskModify(UserCanViewTaskMixin, generic.edit.UpdateView):
+class TaskModify(UserCanViewTaskMixin, LoadMoreMixin, generic.edit.UpdateView):
     model = Task
     template_name = 'imacs_app/task_modify.html'
+    rows_template_name = 'imacs_app/task_modify_task_dones.html'
     context_object_name = 'task'
     pk_url_kwarg = 'task_id'
+    page_size = 50
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        task_id = self.kwargs['task_id']
-        task = get_object_or_404(Task, pk=task_id)
-        task_dones = task.taskdone_set.order_by("-when")
+        task_dones, next_cursor = pagination.get_page(self.object.taskdone_set.all(), self.request.GET.get('after'), self.page_size)
         context['task_dones'] = task_dones
+        context['next_cursor'] = next_cursor
+        if next_cursor is None:
+            # The older history has been compacted, see rollup.py
+            context['rollups'] = self.object.taskdonerollup_set.order_by('-period_start')
         return context
 
     def get_form_class(self):
-        task_id = self.kwargs['task_id']
-        task = get_object_or_404(Task, pk=task_id)
-        return task_model_form_factory(task.task_category.task_list.pk, False)
+        return task_model_form_factory(self.get_permitted_object().task_category.task_list_id, False)
 
 class TaskDelete(UserCanViewTaskMixin, generic.edit.DeleteView):
     model = Task
@@ -323,7 +711,7 @@ class TaskDelete(UserCanViewTaskMixin, generic.edit.DeleteView):
     context_object_name = 'task'
     pk_url_kwarg = 'task_id'
     def get_success_url(self):
-        return reverse('imacs_app:task_list_summary', kwargs={'task_list_id': self.object.task_category.task_list.id})
+        return reverse('imacs_app:task_list_summary', kwargs={'task_list_id': self.object.task_category.task_list_id})
 
 def task_modify_tasked_user_form_factory(task_list_id):
     class TheForm(model_forms.ModelForm):
@@ -340,14 +728,33 @@ class TaskModifyTaskedUser(UserCanViewTaskMixin, generic.edit.UpdateView):
     pk_url_kwarg = 'task_id'
 
     def get_form_class(self):
-        task_id = self.kwargs['task_id']
-        task = get_object_or_404(Task, pk=task_id)
-        return task_modify_tasked_user_form_factory(task.task_category.task_list.pk)
+        return task_modify_tasked_user_form_factory(self.get_permitted_object().task_category.task_list_id)
 
     def get_success_url(self):
-        return reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.object.task_category.task_list.id})
+        return reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.object.task_category.task_list_id})
+
+class TodoFragmentMixin:
+    """Answer the successful POSTs with `?fragment=row` with the updated row and stats of the todo page, instead of a redirection.
+
+    Only this task and the stats (cached) are computed, not the whole todo list.
+    """
+    fragment_template_name = 'imacs_app/task_list_todo_update.html'
 
-class TaskTaskMe(UserCanViewTaskMixin, generic.detail.SingleObjectMixin, generic.edit.FormView):
+    def is_fragment(self):
+        return self.request.GET.get('fragment') == 'row'
+
+    def render_fragment(self, task_id):
+        task = Task.objects.with_priority().select_related('task_category__task_list', 'tasked_user').get(pk=task_id)
+        task_list = task.task_category.task_list
+        return TemplateResponse(self.request, self.fragment_template_name, {'task': task, 'task_list': task_list, 'stats': cached_stats(task_list)})
+
+    def form_invalid(self, form):
+        response = super().form_invalid(form)
+        if self.is_fragment():
+            response.status_code = 400
+        return response
+
+class TaskTaskMe(UserCanViewTaskMixin, TodoFragmentMixin, generic.detail.SingleObjectMixin, generic.edit.FormView):
     model = Task
     template_name = 'imacs_app/task_task_me.html'
     context_object_name = 'task'
@@ -364,17 +771,18 @@ class TaskTaskMe(UserCanViewTaskMixin, generic.detail.SingleObjectMixin, generic
         return super().post(request, *args, **kwargs)
 
     def get_success_url(self):
-        return reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.object.task_category.task_list.id})
+        return reverse('imacs_app:task_list_todo', kwargs={'task_list_id': self.object.task_category.task_list_id})
 
     def form_valid(self, form):
         # TODO is there a better way to do this?
         response = super().form_valid(form)
-        task = get_object_or_404(Task, pk=self.kwargs['task_id'])
-        task.tasked_user = self.request.user
-        task.save()
+        self.object.tasked_user = self.request.user
+        self.object.save(update_fields=['tasked_user'])
+        if self.is_fragment():
+            return self.render_fragment(self.object.pk)
         return response
 
-class TaskDoneAddNow(UserCanViewTaskMixin, generic.edit.CreateView):
+class TaskDoneAddNow(UserCanViewTaskMixin, TodoFragmentMixin, generic.edit.CreateView):
     model = TaskDone
     template_name = 'imacs_app/task_add_done_now.html'
     fields = ['duration']
@@ -382,23 +790,24 @@ class TaskDoneAddNow(UserCanViewTaskMixin, generic.edit.CreateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['task'] = get_object_or_404(Task, pk=self.kwargs['task_id'])
+        context['task'] = self.get_permitted_object()
         return context
 
     def get_success_url(self):
-        task_list_id = self.object.task.task_category.task_list.id
+        task_list_id = self.object.task.task_category.task_list_id
         if self.kwargs['next'] == 'my_tasks':
             return reverse('imacs_app:task_list_my_tasks', kwargs={'task_list_id': task_list_id})
         else:
             return reverse('imacs_app:task_list_todo', kwargs={'task_list_id': task_list_id})
 
     def form_valid(self, form):
-        # TODO is there a better way to do this?
-        form.instance.task_id = self.kwargs['task_id']
+        task = self.get_permitted_object()
+        form.instance.task = task
         response = super().form_valid(form)
-        task = get_object_or_404(Task, pk=self.kwargs['task_id'])
         task.tasked_user = None
-        task.save()
+        task.save(update_fields=['tasked_user'])
+        if self.is_fragment():
+            return self.render_fragment(task.pk)
         return response
 
 class TaskDoneAdd(UserCanViewTaskMixin, generic.edit.CreateView):
@@ -409,14 +818,14 @@ class TaskDoneAdd(UserCanViewTaskMixin, generic.edit.CreateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['task'] = get_object_or_404(Task, pk=self.kwargs['task_id'])
+        context['task'] = self.get_permitted_object()
         return context
 
     def get_success_url(self):
-        return reverse('imacs_app:task_modify', kwargs={'task_id': self.object.task.id})
+        return reverse('imacs_app:task_modify', kwargs={'task_id': self.object.task_id})
 
     def form_valid(self, form):
-        form.instance.task_id = self.kwargs['task_id']
+        form.instance.task = self.get_permitted_object()
         return super().form_valid(form)
 
 class TaskDoneAddRandom(UserCanViewTaskMixin, generic.detail.SingleObjectMixin, generic.edit.FormView):
@@ -447,10 +856,5 @@ class TaskDoneDelete(UserCanViewTaskDoneMixin, generic.edit.DeleteView):
     context_object_name = 'task_done'
     pk_url_kwarg = 'task_done_id'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['task_done'] = get_object_or_404(TaskDone, pk=self.kwargs['task_done_id'])
-        return context
-
     def get_success_url(self):
-        return reverse('imacs_app:task_modify', kwargs={'task_id': self.object.task.id})
+        return reverse('imacs_app:task_modify', kwargs={'task_id': self.object.task_id})
@@ -3,6 +3,10 @@
 let
   cfg = config.services.imacs;
   inherit (lib) types;
+  settingsModule = if cfg.unsafeSettings then "imacs.settings.nix-unsafe" else "imacs.settings.nix";
+  asgiPython = pkgs.python3.withPackages (ps: with ps; [ django_3 numpy psycopg2 uvicorn ]);
+  asgiSocket = "/run/imacs-asgi/imacs.sock";
+  cacheDir = "/var/cache/imacs";
 in {
   options = {
     services.imacs = {
@@ -29,6 +33,27 @@ in {
         type = types.bool;
         default = true;
       };
+      server = lib.mkOption {
+        description = ''
+          How the application is served.
+          "wsgi": the synchronous views, behind the WSGI server of django-nixos.
+          "asgi": the async versions of the read-heavy views (IMACS_ASYNC_VIEWS), behind uvicorn.
+          The WSGI application is still set up (database, static files, keys) and nginx
+          sends the requests to uvicorn instead. Compare both with
+          `manage.py benchmark_concurrency` before switching.
+        '';
+        type = types.enum [ "wsgi" "asgi" ];
+        default = "wsgi";
+      };
+      asgiWorkers = lib.mkOption {
+        description = ''
+          Number of uvicorn worker processes, when served with ASGI.
+          The live updates of the todo pages are published in process
+          (IMACS_EVENTS_BACKEND), so they only reach every page with a single worker.
+        '';
+        type = types.ints.positive;
+        default = 1;
+      };
     };
   };
 
@@ -40,17 +65,59 @@ in {
           root = ./.;
           inherit (cfg) keysFile setupNginx hostName;
           unixSocket.path = "/run/imacs.sock";
-          django.settings =
-            if cfg.unsafeSettings
-            then "imacs.settings.nix-unsafe"
-            else "imacs.settings.nix";
+          django.settings = settingsModule;
           security.noNetwork = true;
         };
+        # The cache shared by the workers (CACHES in imacs/settings/nix.py)
+        systemd.tmpfiles.rules = [ "d ${cacheDir} 0750 imacs imacs -" ];
       }
-      (lib.mkIf (cfg.enable && cfg.setupNginx) { services.nginx.enable = true; })
+      (lib.mkIf (cfg.enable && cfg.setupNginx) {
+        services.nginx.enable = true;
+        # collectstatic writes .gz and .br siblings of the static files (imacs_app/storage.py)
+        services.nginx.additionalModules = [ pkgs.nginxModules.brotli ];
+        # The collected files with a content hash in their name never change
+        services.nginx.appendHttpConfig = ''
+          map $uri $imacs_static_cache_control {
+            "~\.[0-9a-f]{12}\.[^/.]+$" "public, max-age=31536000, immutable";
+            default "no-cache";
+          }
+        '';
+        services.nginx.virtualHosts."${cfg.hostName}".locations."/static/".extraConfig = ''
+          gzip_static on;
+          brotli_static on;
+          add_header Cache-Control $imacs_static_cache_control;
+        '';
+      })
       (lib.mkIf (cfg.enable && cfg.setupNginx && !cfg.unsafeSettings) {
         services.nginx.virtualHosts."${cfg.hostName}".forceSSL = true;
       })
       (lib.mkIf cfg.unsafeSettings { warnings = [ "IMACS is configured with unsafe settings" ]; })
+      (lib.mkIf (cfg.server == "asgi") {
+        systemd.services.imacs-asgi = {
+          description = "IMACS, served with ASGI";
+          after = [ "network.target" "postgresql.service" ];
+          wantedBy = [ "multi-user.target" ];
+          environment = {
+            DJANGO_SETTINGS_MODULE = settingsModule;
+            IMACS_ASGI = "1";
+            ALLOWED_HOSTS = cfg.hostName;
+            # The same user and database as the WSGI application
+            DB_NAME = "imacs";
+            CACHE_DIR = cacheDir;
+            PYTHONPATH = "${./.}";
+          };
+          serviceConfig = {
+            User = "imacs";
+            EnvironmentFile = cfg.keysFile;
+            RuntimeDirectory = "imacs-asgi";
+            ExecStart = "${asgiPython}/bin/uvicorn --uds ${asgiSocket} --workers ${toString cfg.asgiWorkers} imacs.asgi:application";
+            PrivateNetwork = true;
+          };
+        };
+      })
+      (lib.mkIf (cfg.server == "asgi" && cfg.setupNginx) {
+        users.users.nginx.extraGroups = [ "imacs" ];
+        services.nginx.virtualHosts."${cfg.hostName}".locations."/".proxyPass = lib.mkForce "http://unix:${asgiSocket}";
+      })
     ]);
 }